@@ -0,0 +1,115 @@
+import os
+import sys
+import resource
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from BacktestRunner import Backtest_Traditional
+
+# ---- Compares the loop and the numpy engines of run_backtest on synthetic 1-minute data ---- #
+
+# -- Writes a random walk OHLCV csv with the same columns of the historical data -- #
+def synthetic_csv(path, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 40_000 * np.exp(np.cumsum(rng.normal(0, 1e-3, n_rows)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2021-01-01', periods=n_rows, freq='1min'),
+        'volume': rng.uniform(1, 100, n_rows),
+        'open': open_,
+        'low': np.minimum(open_, close) * 0.999,
+        'high': np.maximum(open_, close) * 1.001,
+        'close': close,
+    })
+    df.to_csv(path, index=False)
+
+# -- Strategy with random long/short signals, only used to stress the engines -- #
+class RandomSignals(Backtest_Traditional):
+    def __init__(self, csv_path, date_col, max_holding, ub_mult, lb_mult, signal_prob=0.01, seed=1):
+        super().__init__(csv_path, date_col, max_holding)
+        self.ub_mult = ub_mult
+        self.lb_mult = lb_mult
+        self.signal_prob = signal_prob
+        self.seed = seed
+
+    def generate_signals(self):
+        df = self.dmgt.df
+        rng = np.random.default_rng(self.seed)
+        draw = rng.random(len(df))
+        df['entry'] = np.where(draw < self.signal_prob / 2, 1, np.where(draw > 1 - self.signal_prob / 2, -1, 0))
+
+# -- Runs both engines on the same data, checks that the trade columns are identical and returns the timings -- #
+def compare_engines(csv_path, max_holding=55, ub_mult=1.003, lb_mult=0.997, run_loop=True):
+    timings = {}
+    results = {}
+    engines = ['numpy', 'loop'] if run_loop else ['numpy']
+    for engine in engines:
+        system = RandomSignals(csv_path, 'timestamp', max_holding, ub_mult, lb_mult)
+        t = time.perf_counter()
+        system.run_backtest(engine=engine)
+        timings[engine] = time.perf_counter() - t
+        results[engine] = system.dmgt.df[['returns', 'holding', 'direction']]
+    if run_loop:
+        pd.testing.assert_frame_equal(results['numpy'], results['loop'], check_dtype=False)
+    return timings
+
+# -- Runs a numpy-engine LSTM backtest on the csv and returns the peak RSS of the process in MiB -- #
+# mode is 'imports' (only the modules are loaded), 'default' or 'lean' (DataManager_LSTM(lean=True)), run it in a fresh process
+def lstm_peak_rss(csv_path, mode):
+    from Datamanager import DataManager_LSTM
+    from Backtest_LSTM import LSTM
+    if mode != 'imports':
+        system = LSTM(DataManager_LSTM(csv_path, lean=mode == 'lean'), 55, feature_store=False, prediction_cache=False)
+        system.run_backtest(engine='numpy')
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# -- Peak RSS of the LSTM backtest on n_rows synthetic bars for each mode, every mode in its own process -- #
+def compare_lstm_memory(n_rows, modes=('imports', 'default', 'lean')):
+    peaks = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, f'synthetic_{n_rows}.csv')
+        synthetic_csv(csv_path, n_rows)
+        # Fills the binary cache of the csv, the measured processes only read it
+        subprocess.run([sys.executable, __file__, '--rss-run', csv_path, 'default'], check=True, capture_output=True)
+        for mode in modes:
+            out = subprocess.run([sys.executable, __file__, '--rss-run', csv_path, mode], check=True, capture_output=True, text=True).stdout
+            peaks[mode] = float(out.split()[-1])
+    return peaks
+
+if __name__ == '__main__':
+    # Child process of compare_lstm_memory
+    if '--rss-run' in sys.argv:
+        i = sys.argv.index('--rss-run')
+        print(lstm_peak_rss(sys.argv[i + 1], sys.argv[i + 2]))
+        sys.exit()
+
+    # --rss [n_rows] only measures the peak RSS of the LSTM backtest with the default and the lean data manager
+    if '--rss' in sys.argv:
+        i = sys.argv.index('--rss')
+        n_rows = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 else 800_000
+        peaks = compare_lstm_memory(n_rows)
+        print(f"{n_rows:>10,} rows LSTM backtest | peak RSS: imports only {peaks['imports']:6.0f} MiB | default {peaks['default']:6.0f} MiB | lean {peaks['lean']:6.0f} MiB")
+        sys.exit()
+
+    # Row counts of the benchmark, the loop engine is skipped above loop_limit rows unless --all is passed
+    sizes = [160_000, 800_000, 8_000_000]
+    loop_limit = 800_000 if '--all' not in sys.argv else sizes[-1]
+    # Seconds per row of the largest loop run, the loop engine costs the same per bar so a skipped run is extrapolated
+    loop_rows, loop_per_row = None, None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in sizes:
+            csv_path = os.path.join(tmp, f'synthetic_{n_rows}.csv')
+            synthetic_csv(csv_path, n_rows)
+            timings = compare_engines(csv_path, run_loop=n_rows <= loop_limit)
+            if 'loop' in timings:
+                loop_rows, loop_per_row = n_rows, timings['loop'] / n_rows
+                print(f"{n_rows:>10,} rows | loop {timings['loop']:8.2f}s | numpy {timings['numpy']:6.2f}s | speed-up x{timings['loop'] / timings['numpy']:.0f} | parity ok")
+            elif loop_per_row is not None:
+                loop_time = loop_per_row * n_rows
+                print(f"{n_rows:>10,} rows | loop {loop_time:8.2f}s | numpy {timings['numpy']:6.2f}s | speed-up x{loop_time / timings['numpy']:.0f} | loop estimated from the {loop_rows:,} rows run")
+            else:
+                print(f"{n_rows:>10,} rows | loop  skipped | numpy {timings['numpy']:6.2f}s")
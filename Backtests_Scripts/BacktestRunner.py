@@ -1,4 +1,5 @@
 from Datamanager import DataManager_LSTM, DataManager_Traditional
+from TripleBarrier import triple_barrier, TradeLedger
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
@@ -6,7 +7,11 @@ import numpy as np
 # ---- Class that does the LSTM strategy backtest ---- #
 class Backtest_LSTM:
     def __init__(self, csv_path, maximum_holding):
-        self.dmgt = DataManager_LSTM(csv_path)
+        # csv_path can also be an already loaded DataManager_LSTM (e.g. restricted to a date range)
+        if isinstance(csv_path, DataManager_LSTM):
+            self.dmgt = csv_path
+        else:
+            self.dmgt = DataManager_LSTM(csv_path)
         # Trade variables
         self.open_pos = False
         self.entry_price = None
@@ -26,6 +31,8 @@ class Backtest_LSTM:
         self.returns_series = []
         self.holding_series = []
         self.direction_series = []
+        # Trades of the numpy/ledger engines
+        self.ledger = None
 
         self.long_short_close = [] # ADD
         self.long_open = [] # ADD
@@ -41,8 +48,8 @@ class Backtest_LSTM:
         self.add_zeros()
         
         self.long_open.append(price) # ADD
-        self.short_open.append(np.NaN) # ADD
-        #self.long_short_close.append(np.NaN) # ADD
+        self.short_open.append(np.nan) # ADD
+        #self.long_short_close.append(np.nan) # ADD
 
     # -- Function that receive the price at which the short position should bee initiated and populates trade variables from constructor with relevant variables -- #
     def open_short(self, price):
@@ -54,8 +61,8 @@ class Backtest_LSTM:
         self.add_zeros()
 
         self.short_open.append(price) # ADD
-        self.long_open.append(np.NaN) # ADD
-        #self.long_short_close.append(np.NaN) # ADD
+        self.long_open.append(np.nan) # ADD
+        #self.long_short_close.append(np.nan) # ADD
 
     # -- Resets the variables after we close a trade -- #
     def reset_variables(self):
@@ -72,17 +79,17 @@ class Backtest_LSTM:
         self.holding_series.append(0)
         self.direction_series.append(0)
 
-        self.long_short_close.append(np.NaN) # ADD
-        self.long_open.append(np.NaN) # ADD
-        self.short_open.append(np.NaN) # ADD
+        self.long_short_close.append(np.nan) # ADD
+        self.long_open.append(np.nan) # ADD
+        self.short_open.append(np.nan) # ADD
         #self.long_open.append(0) # ADD
         #self.short_open.append(0) # ADD
 
     # -- Function that appends NaN, meaning "nothing", to the missing slots. The purpose is plotting the graph of buys and sells. Adding a zero then it will show the point even without a transaction there -- #
     def add_nan(self): # ADD
-        self.long_short_close.append(np.NaN) # ADD
-        #self.long_open.append(np.NaN) # ADD
-       #self.short_open.append(np.NaN) # ADD
+        self.long_short_close.append(np.nan) # ADD
+        #self.long_open.append(np.nan) # ADD
+       #self.short_open.append(np.nan) # ADD
 
     # -- Receives the exite price and appends the trade Profit & Loss (pnl) to the returns series and resets variables -- #
     def close_position(self, price):
@@ -91,8 +98,8 @@ class Backtest_LSTM:
         self.reset_variables()
 
         self.long_short_close.append(price) # ADD
-        #self.long_open.append(np.NaN) # ADD
-        #self.short_open.append(np.NaN) # ADD
+        #self.long_open.append(np.nan) # ADD
+        #self.short_open.append(np.nan) # ADD
 
     # -- Update parameters -- #
     def process_close_var(self, pnl):
@@ -137,9 +144,11 @@ class Backtest_LSTM:
         self.dmgt.df['holding'] = self.holding_series
         self.dmgt.df['direction'] = self.direction_series
 
+        # A signal on the last bar opens a position that is never closed, its opening price would fall after the last bar
+        n = len(self.dmgt.df)
         self.dmgt.df['long_short_close'] = self.long_short_close # ADD
-        self.dmgt.df['long_open'] = self.long_open # ADD
-        self.dmgt.df['short_open'] = self.short_open # ADD
+        self.dmgt.df['long_open'] = self.long_open[:n] # ADD
+        self.dmgt.df['short_open'] = self.short_open[:n] # ADD
 
         self.long_short_close = [] # ADD
         self.long_open = [] # ADD
@@ -149,8 +158,13 @@ class Backtest_LSTM:
         self.holding_series = []
         self.direction_series = []
 
-    # -- Backtest heart -- #
-    def run_backtest(self):
+    # -- Backtest heart, engine='numpy' finds the barrier touches with array operations instead of looping over the rows -- #
+    # -- engine='ledger' does the same but only keeps the trades in self.ledger, the per-bar columns are added when they are needed -- #
+    def run_backtest(self, engine='loop'):
+        if engine in ('numpy', 'ledger'):
+            return self.run_backtest_numpy(dense=engine == 'numpy')
+        elif engine != 'loop':
+            raise ValueError('engine must be loop, numpy or ledger')
         # Signals generated from child class
         self.generate_signals()
         # Loop over dataframe
@@ -167,14 +181,50 @@ class Backtest_LSTM:
             else:
                 self.add_zeros()
         self.add_trade_cols()
+
+    # -- Same as run_backtest but vectorized, the trades are found with the triple barrier engine and kept in a TradeLedger -- #
+    def run_backtest_numpy(self, dense=True):
+        self.generate_signals()
+        df = self.dmgt.df
+        trades = triple_barrier(df.entry.values, df.t_plus.values, df.close.values, df.index.values == self.end_date,
+                                self.ub_mult, self.lb_mult, self.max_holding_limit)
+        self.ledger = TradeLedger(trades, df.index)
+        if dense:
+            self.add_ledger_cols()
+
+    # -- Merges the trades of the ledger into the dataframe as per-bar columns -- #
+    def add_ledger_cols(self):
+        df = self.dmgt.df
+        n = len(df)
+        ledger = self.ledger
+        for col, values in ledger.to_dense().items():
+            df[col] = values
+        # Columns used to plot buys and sells, the loop records the opening price one bar after the signal
+        long_short_close = np.full(n, np.nan)
+        long_open = np.full(n, np.nan)
+        short_open = np.full(n, np.nan)
+        long_short_close[ledger.exit_idx] = ledger.exit_price
+        marker = ledger.entry_idx + 1
+        longs = (ledger.direction == 1) & (marker < n)
+        shorts = (ledger.direction == -1) & (marker < n)
+        long_open[marker[longs]] = ledger.entry_price[longs]
+        short_open[marker[shorts]] = ledger.entry_price[shorts]
+        df['long_short_close'] = long_short_close
+        df['long_open'] = long_open
+        df['short_open'] = short_open
     
     # -- Show a performance graph of the backtest -- #
     def show_performace(self):
+        # After a ledger backtest the per-bar columns are only built now
+        if 'returns' not in self.dmgt.df.columns and self.ledger is not None:
+            self.add_ledger_cols()
         self.dmgt.df.returns.cumsum().plot()
         plt.title(f"Strategy results for {self.dmgt.timeframe} timeframe")
         plt.show()
 
     def save_backtest(self):
+        if 'returns' not in self.dmgt.df.columns and self.ledger is not None:
+            self.add_ledger_cols()
         strat_name = self.__class__.__name__
         tf = self.dmgt.timeframe
         self.dmgt.df.to_csv(f"../Backtests_Data/{strat_name}_{tf}.csv")
@@ -182,7 +232,11 @@ class Backtest_LSTM:
 # ---- Class that does backtest for traditional strategies ---- #
 class Backtest_Traditional:
     def __init__(self, csv_path, date_col, maximum_holding):
-        self.dmgt = DataManager_Traditional(csv_path, date_col)
+        # csv_path can also be an already loaded DataManager_Traditional (e.g. restricted to a date range), so the csv is not read again
+        if isinstance(csv_path, DataManager_Traditional):
+            self.dmgt = csv_path
+        else:
+            self.dmgt = DataManager_Traditional(csv_path, date_col)
         # Trade variables
         self.open_pos = False
         self.entry_price = None
@@ -201,6 +255,8 @@ class Backtest_Traditional:
         self.returns_series = []
         self.holding_series = []
         self.direction_series = []
+        # Trades of the numpy/ledger engines
+        self.ledger = None
 
     # -- Function that receive the price at which the long position should bee initiated and populates trade variables from constructor with relevant variables -- #
     def open_long(self, price):
@@ -287,8 +343,13 @@ class Backtest_Traditional:
         self.holding_series = []
         self.direction_series = []
 
-    # -- Backtest heart -- #
-    def run_backtest(self):
+    # -- Backtest heart, engine='numpy' finds the barrier touches with array operations instead of looping over the rows -- #
+    # -- engine='ledger' does the same but only keeps the trades in self.ledger, the per-bar columns are added when they are needed -- #
+    def run_backtest(self, engine='loop'):
+        if engine in ('numpy', 'ledger'):
+            return self.run_backtest_numpy(dense=engine == 'numpy')
+        elif engine != 'loop':
+            raise ValueError('engine must be loop, numpy or ledger')
         # Signals generated from child class
         self.generate_signals()
         # Loop over dataframe
@@ -305,14 +366,34 @@ class Backtest_Traditional:
             else:
                 self.add_zeros()
         self.add_trade_cols()
+
+    # -- Same as run_backtest but vectorized, the trades are found with the triple barrier engine and kept in a TradeLedger -- #
+    def run_backtest_numpy(self, dense=True):
+        self.generate_signals()
+        df = self.dmgt.df
+        trades = triple_barrier(df.entry.values, df.t_plus.values, df.close.values, df.index.values == self.end_date,
+                                self.ub_mult, self.lb_mult, self.max_holding_limit)
+        self.ledger = TradeLedger(trades, df.index)
+        if dense:
+            self.add_ledger_cols()
+
+    # -- Merges the trades of the ledger into the dataframe as per-bar columns -- #
+    def add_ledger_cols(self):
+        for col, values in self.ledger.to_dense().items():
+            self.dmgt.df[col] = values
     
     # -- Show a performance graph of the backtest -- #
     def show_performace(self):
+        # After a ledger backtest the per-bar columns are only built now
+        if 'returns' not in self.dmgt.df.columns and self.ledger is not None:
+            self.add_ledger_cols()
         self.dmgt.df.returns.cumsum().plot()
         plt.title(f"Strategy results for {self.dmgt.timeframe} timeframe")
         plt.show()
 
     def save_backtest(self):
+            if 'returns' not in self.dmgt.df.columns and self.ledger is not None:
+                self.add_ledger_cols()
             strat_name = self.__class__.__name__
             tf = self.dmgt.timeframe
             self.dmgt.df.to_csv(f"../Backtests_Data/{strat_name}_{tf}.csv")
\ No newline at end of file
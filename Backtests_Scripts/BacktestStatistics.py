@@ -48,7 +48,7 @@ class BacktestStatistics:
         return round(dd,3)
 
     def cagr(cum_rets_series, N):
-        cagr = float((cum_rets_series[-1:].values)**(1/(len(cum_rets_series)/N)))-1
+        cagr = float(cum_rets_series.iloc[-1]**(1/(len(cum_rets_series)/N)))-1
         return round(cagr,3)
 
 class BacktestProfile:
@@ -88,6 +88,7 @@ class BacktestProfile:
         self.calmar = BacktestStatistics.calmar_ratio(self.bt.returns_f, self.N, self.max_dd)
 
         self.long_accuracy, self.short_accuracy = self.accuracy()
+        self.total_return = self.bt.returns_fees.iloc[-1] - 1
 
     @staticmethod
     def fees_calc(returns_col, fees):
@@ -113,8 +114,9 @@ class BacktestProfile:
     def accuracy(self):
         longs = self.bt[self.bt.direction ==1]
         shorts = self.bt[self.bt.direction == -1]
-        long_acc = len(longs[longs.returns_f > 0])/len(longs)
-        short_acc = len(shorts[shorts.returns_f >0])/len(shorts)
+        # NaN when the backtest did not open any position of that side
+        long_acc = len(longs[longs.returns_f > 0])/len(longs) if len(longs) else np.nan
+        short_acc = len(shorts[shorts.returns_f >0])/len(shorts) if len(shorts) else np.nan
         return round(long_acc, 3), round(short_acc, 3)
 
     def show_ratios(self):
@@ -180,6 +182,71 @@ class BacktestProfile:
         self.show_ratios()
         print('==' * 50)
 
+# ---- Same statistics as BacktestProfile computed from a TradeLedger, the cost depends on the number of trades and not of bars ---- #
+class LedgerProfile:
+    def __init__(self, ledger, freq, ret_type='comp', spread=0.5/42000, fees=5e-4):
+        if ret_type not in ('comp', 'simple'):
+            raise ValueError('Ret type not recognized must be: {comp} or {simple}')
+        self.fees = fees + spread
+        self.ledger = ledger
+        self.N = BacktestStatistics.N_annual(freq)
+        self.ret_type = ret_type
+        n = ledger.n_bars
+        # Returns after fees of the trades, the bars without a closed trade have a return of 0 (as in fees_calc)
+        returns_f = np.where(ledger.pnl != 0, ledger.pnl - fees * 2, 0)
+        self.returns_f = returns_f
+
+        self.n_longs = int((ledger.direction == 1).sum())
+        self.n_shorts = int((ledger.direction == -1).sum())
+        self.n_trades = self.n_longs + self.n_shorts
+
+        # Equity only changes when a trade is closed
+        compounded = np.cumprod(returns_f + 1)
+        final = compounded[-1] if len(compounded) else 1.0
+        if ret_type == 'simple':
+            final = returns_f.sum() + 1
+        # Drawdowns of the compounded equity, starting from 1 before the first trade
+        equity = np.concatenate([[1.0], compounded])
+        dd = equity / np.maximum.accumulate(equity) - 1
+        self.max_dd = round(dd.min(), 3)
+        # NaN ratios when the backtest has less than two bars, there is no sample standard deviation (nor annualised return)
+        if n <= 1:
+            self.sharpe = self.cagr = self.calmar = np.nan
+        else:
+            # Mean and sample standard deviation of the per-bar returns, the n - len(ledger) bars without a trade count as zeros
+            mean = np.float64(returns_f.sum() / n)
+            std = np.sqrt((np.square(returns_f - mean).sum() + (n - len(returns_f)) * mean ** 2) / (n - 1))
+            # Same numpy division as BacktestStatistics (inf or nan when there is no variance or no drawdown)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.sharpe = round(mean * self.N / (std * np.sqrt(self.N)), 3)
+                self.calmar = round(mean * self.N / np.abs(self.max_dd), 3)
+            self.cagr = round(float(final ** (1 / (n / self.N))) - 1, 3)
+        self.total_return = final - 1
+
+        longs = returns_f[ledger.direction == 1]
+        shorts = returns_f[ledger.direction == -1]
+        # NaN when the backtest did not open any position of that side
+        self.long_accuracy = round((longs > 0).mean(), 3) if len(longs) else np.nan
+        self.short_accuracy = round((shorts > 0).mean(), 3) if len(shorts) else np.nan
+
+    def show_ratios(self):
+        BacktestProfile.show_ratios(self)
+
+# -- Summary metrics of a BacktestProfile or LedgerProfile -- #
+def profile_metrics(profile):
+    return {
+        'n_trades': profile.n_trades,
+        'n_longs': profile.n_longs,
+        'n_shorts': profile.n_shorts,
+        'total_return': profile.total_return,
+        'sharpe': profile.sharpe,
+        'cagr': profile.cagr,
+        'calmar': profile.calmar,
+        'max_dd': profile.max_dd,
+        'long_accuracy': profile.long_accuracy,
+        'short_accuracy': profile.short_accuracy,
+    }
+
 if __name__ == '__main__':
     bt = pd.read_csv("../Backtests_Data/Backtest_LSTM.csv") # Choose the backtest previously made for which you want the statistics of it
     freq = '1min' # Should match the frequency of the backtest previously made
@@ -1,81 +1,164 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 from BacktestRunner import Backtest_LSTM
-from TechnicalIndicator import get_technical_indicators
-import tensorflow as tf
-from tensorflow import keras
-from pickle import load
+from BacktestStatistics import LedgerProfile, profile_metrics
+from TripleBarrier import triple_barrier, TradeLedger
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import feature_matrix, valid_features
+from FeatureStore import FeatureStore, validate_bars
+from ModelRegistry import get_model, model_spec
+from PredictionCache import PredictionCache
 
 # ---- Contains the LSTM algorithm ---- #
 class LSTM(Backtest_LSTM):
 
-    def __init__(self, csv_path, max_holding):
+    def __init__(self, csv_path, max_holding, entry_cond=0.03, feature_store=True, model='test_69', batch_size=16_384, n_workers=1, prediction_cache=True, ensemble='mean'):
         super().__init__(csv_path, max_holding)
+        # Difference in price and precition that has to present in order to generate a signal (not in %)
+        self.entry_cond = entry_cond
+        # The features are read from the feature store of the csv unless feature_store=False (or the data is not read from a csv)
+        self.feature_store = FeatureStore.for_csv(csv_path) if feature_store and isinstance(csv_path, str) else None
+        # Model of the shared model registry (loaded once per process): the name it is saved under or a (model_path, scaler_path) pair.
+        # A list of them backtests their ensemble, with the predictions and signals of every model in their own columns
+        self.models = [model_spec(m) for m in (model if isinstance(model, list) else [model])]
+        names = [name for name, _, _ in self.models]
+        if len(set(names)) != len(names):
+            raise ValueError(f'The models must have different names, got {names}')
+        # How the predictions of the models are combined: mean or median of the predicted prices
+        if ensemble not in ('mean', 'median'):
+            raise ValueError('ensemble must be mean or median')
+        self.ensemble = ensemble
+        self.model_predictions = None
+        # Rows scaled and predicted at a time (the memory used by the inference does not depend on the length of the data) and threads running the batches
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        # Predictions saved on disk by model, scaler and data, the backtests on the same bars do not run the model again
+        self.prediction_cache = PredictionCache() if prediction_cache else None
 
-    # -- Function that validates the data -- #
+    # -- Function that validates the data, returns the bars on which all the features are defined and their feature matrix -- #
     def data_validation(self, data):
-        df = data.copy()
-        # Change timestamp column to datetime 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        # Drop duplicates
-        df.drop_duplicates(subset=['timestamp'], keep='first', inplace=True)
-        df.reset_index(inplace=True)
-        keep_cols = ['volume','open','low','high','close','timestamp','t_plus']
-        for i in df.columns:
-            if i in keep_cols:
-                pass
+        df = validate_bars(data)
+        features = None
+        if self.feature_store is not None:
+            try:
+                # Features of the whole history read from the memory-mapped store, only new bars are computed
+                self.feature_store.sync()
+                features = self.feature_store.rows(df.timestamp.values)
+            except (OSError, ValueError):
+                # The store cannot be written or does not cover the bars (e.g. data that is not the csv), compute them
+                features = None
+        if features is None:
+            # Technical indicators written straight into a float32 (n, 30) matrix in the order of the scaler
+            features = feature_matrix(df.open.values, df.high.values, df.low.values, df.volume.values)
+        features, rows = valid_features(features)
+        df = df.iloc[rows].copy(deep=False)
+        return df, features
+
+    # -- Scale the feature matrix that is going to be used in the LSTM algorithm, returns it with shape (n, 1, 30) -- #
+    # model is the name of one of the models of the backtest, it can only be omitted when there is one model
+    def scaler(self, features, model=None):
+        specs = {spec[0]: spec for spec in self.models}
+        if model is None and len(specs) > 1:
+            raise ValueError(f'The backtest has several models, choose the scaler of one of {list(specs)}')
+        spec = self.models[0] if model is None else specs[model]
+        # Scaler used during the training of the neural network
+        return get_model(*spec).scale(features)
+
+    # -- Runs the models, returns the validated data and the (n, 1) float32 predictions of every model by name -- #
+    # The features are computed once for all the models, then the models that are not in the prediction cache run concurrently
+    def predict_models(self):
+        # Validated bars, the predictions are read from the cache or computed on the bars where all the features are defined
+        bars = validate_bars(self.dmgt.df)
+        models = [get_model(*spec) for spec in self.models]
+        preds, keys, rows = {}, {}, None
+        if self.prediction_cache is not None:
+            for lstm in models:
+                keys[lstm.name] = self.prediction_cache.key(lstm, bars)
+                cached = self.prediction_cache.load(keys[lstm.name])
+                if cached is not None:
+                    # The rows only depend on the features, they are the same for all the models
+                    rows, preds[lstm.name] = cached
+        missing = [lstm for lstm in models if lstm.name not in preds]
+        if missing:
+            data, features = self.data_validation(bars)
+            # LSTM, the features are scaled and predicted batch by batch into a float32 (n, 1) array
+            predict = lambda lstm: lstm.predict(features, self.batch_size, self.n_workers)
+            if len(missing) == 1:
+                results = [predict(missing[0])]
             else:
-                del df[i]
-        # Add technical indicators to the dataset
-        df = get_technical_indicators(df)
-        # Reorder columns
-        columns_titles = ['timestamp','open','low','high','close','volume','t_plus','ma5','ma20','ma30','ma60','26ema','12ema','MACD','20sd','upper_band','lower_band','ewma','RSI','log_ret_1','log_ret_2','log_ret_3','log_ret_4','log_ret_5','cum_log_ret_3','cum_log_ret_5','diff_cum_log_ret','ROC_9','ROC_14','DEMA_short','DEMA_long','momentum','log_momentum']
-        df=df.reindex(columns=columns_titles)
-        df = df.dropna()
-        return df
+                with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                    results = list(pool.map(predict, missing))
+            for lstm, pred in zip(missing, results):
+                preds[lstm.name] = pred
+                if self.prediction_cache is not None:
+                    # The index of the validated bars is their position
+                    self.prediction_cache.save(keys[lstm.name], data.index.values, pred)
+        else:
+            data = bars.iloc[rows].copy(deep=False)
+        return data, {lstm.name: preds[lstm.name] for lstm in models}
 
-    # -- Scale data that are going to be used in the LSTM algorithm -- #
-    def scaler(self, df):
-        # Selecting the Features
-        features = ['low','high','open','volume','ma5','ma20','ma30','ma60','26ema','12ema','MACD','20sd','upper_band','lower_band','ewma','RSI','log_ret_1','log_ret_2','log_ret_3','log_ret_4','log_ret_5','cum_log_ret_3','cum_log_ret_5','diff_cum_log_ret','ROC_9','ROC_14','DEMA_short','DEMA_long','momentum','log_momentum']
-        # Load the scaler used during the training of the neural network
-        scaler = load(open('../LSTM_MinMaxModels/MinMaxModel_test_69.pkl', 'rb'))
-        # Add the scaler to the dataframe
-        feature_transform = scaler.transform(df[features])
-        feature_transform = pd.DataFrame(columns=features, data=feature_transform, index=df.index)
-        df = feature_transform
-        df = np.array(df)
-        df = df.reshape(df.shape[0], 1, df.shape[1])
-        return df
+    # -- Function that runs the LSTM, returns the validated data, the predictions and their relative difference with the close price -- #
+    # With several models the predictions are the ensemble ones
+    def predict(self):
+        data, preds = self.predict_models()
+        if len(preds) == 1:
+            pred = next(iter(preds.values()))
+        else:
+            combine = np.mean if self.ensemble == 'mean' else np.median
+            pred = combine(np.concatenate(list(preds.values()), axis=1), axis=1, keepdims=True).astype(np.float32)
+        previously = data.close.values.reshape(-1, 1)
+        # (n, 1) / (n, 1), one relative difference per bar
+        res = pred / previously - 1
+        # Kept for the per-model columns of generate_signals
+        self.model_predictions = preds
+        return data, pred, res
+
+    # -- Entry signals (1 long, -1 short, 0 nothing) of relative differences -- #
+    def signals(self, res):
+        return (1 * (res > self.entry_cond) - 1 * (res < -self.entry_cond)).reshape(-1)
 
     # -- Function that generate signals -- #
     def generate_signals(self):
-        # Generate two dataframes with the correct format and columns. Data_processed are ready to be inserted in the LSTM algorithm
-        df = self.dmgt.df
-        data = self.data_validation(df)
-        data_processed = self.scaler(data)
-        previously = data.close.values.reshape(-1, 1)
-        # LSTM 
-        lstm = keras.models.load_model('../LSTM_Models/test_69.h5')
-        pred = lstm(data_processed)
-        res = np.array(tf.math.divide(pred,previously)-1)
+        data, pred, res = self.predict()
         # Signal generator
-        entry_cond = 0.03 # Difference in price and precition that has to present in order to generate a signal (not in %)
-        data['long_entry'] = 1 * (res > entry_cond)
-        data['short_entry'] = -1 * (res < -entry_cond)
+        data['long_entry'] = 1 * (res > self.entry_cond)
+        data['short_entry'] = -1 * (res < -self.entry_cond)
         data['entry'] = data.long_entry + data.short_entry # Signal added to the dataframe
         data['prediction'] = pred
+        if len(self.models) > 1:
+            # The backtest runs on the ensemble signals, the ones of every model are kept to compare them
+            previously = data.close.values.reshape(-1, 1)
+            for name, model_pred in self.model_predictions.items():
+                data[f'prediction_{name}'] = model_pred
+                data[f'entry_{name}'] = self.signals(model_pred / previously - 1)
         self.dmgt.df = data
 
+    # -- Metrics of the signals of every model and of their ensemble on the bars of the backtest (after generate_signals or run_backtest) -- #
+    def model_profiles(self):
+        df = self.dmgt.df
+        at_end = df.index.values == self.end_date
+        columns = {name: f'entry_{name}' for name, _, _ in self.models} if len(self.models) > 1 else {}
+        columns['ensemble' if len(self.models) > 1 else self.models[0][0]] = 'entry'
+        rows = []
+        for name, col in columns.items():
+            trades = triple_barrier(df[col].values, df.t_plus.values, df.close.values, at_end, self.ub_mult, self.lb_mult, self.max_holding_limit)
+            rows.append(dict(model=name, **profile_metrics(LedgerProfile(TradeLedger(trades, df.index), self.dmgt.timeframe))))
+        return pd.DataFrame(rows).set_index('model')
+
 if __name__ == '__main__':
     # Universal parameters
     csv_path = '../Data/BPF_testset_1min.csv'
     maximum_holding = 55 # Minutes
 
     system = LSTM(csv_path, maximum_holding)
+    # Ensemble of several models (e.g. test_69 and another one saved in LSTM_Models), the features are computed once
+    #system = LSTM(csv_path, maximum_holding, model=['test_69', ('../LSTM_Models/test_70.npz', '../LSTM_MinMaxModels/MinMaxModel_test_70.pkl')])
 
     system.run_backtest()
     system.show_performace()
 
+    print(system.model_profiles())
+
     system.dmgt.df.to_csv('../Backtests_Data/Backtest_LSTM.csv')
\ No newline at end of file
@@ -1,7 +1,79 @@
 import numpy as np
 from BacktestRunner import Backtest_Traditional
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import ewm_mean
+
+# ---- Signals of the strategies as pure functions of the OHLCV arrays ---- #
+# They return the int8 entry array (1 long, -1 short, 0 nothing) and the boolean array of the bars where all the
+# indicators are defined (the other bars were dropped by the dropna of the previous generate_signals, their entry is 0).
+# The parameters can be scalars or 1-D arrays of the same length, one parameter set per row of the (n_sets, n_bars) results.
+# The indicators are computed once for every distinct value of their parameters and shared by the rows. indicator(name, fn)
+# can return them from a cache shared with other strategies (e.g. MultiStrategyBacktest), by default fn() computes them.
+
+# -- Bars where the prices are defined (resampled bins without any trade are NaN), the volume is optional -- #
+def valid_bars(*values):
+    return ~np.logical_or.reduce([np.isnan(np.asarray(x, dtype=np.float64)) for x in values if x is not None])
+
+# -- Parameters as 1-D arrays of the same length, and whether they were all scalars -- #
+def parameter_sets(*params):
+    single = all(np.ndim(p) == 0 for p in params)
+    return np.broadcast_arrays(*(np.atleast_1d(p) for p in params)), single
+
+# -- RSI of the close with exponential averages of the up and down changes (span=window) -- #
+def rsi(close, window):
+    change = np.diff(close, prepend=np.nan)
+    # The first change (and the ones next to a missing bar) is NaN and counts as no change
+    up = ewm_mean(np.where(change > 0, change, 0.), 2 / (window + 1), window - 1)
+    down = ewm_mean(np.where(change < 0, -change, 0.), 2 / (window + 1), window - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + up / down)
+
+def momentum_rsi_signals(open, high, low, close, volume, rsi_window, rsi_long, rsi_short, ma_long, ma_short, indicator=None):
+    close = np.asarray(close, dtype=np.float64)
+    bars = valid_bars(open, high, low, close, volume)
+    (rsi_window, rsi_long, rsi_short, ma_long, ma_short), single = parameter_sets(rsi_window, rsi_long, rsi_short, ma_long, ma_short)
+    indicator = indicator or (lambda name, fn: fn())
+    rsis = {w: indicator(f'rsi_{w}', lambda w=w: rsi(close, w)) for w in np.unique(rsi_window)}
+    mas = {span: indicator(f'ma_{span}', lambda span=span: ewm_mean(close, 2 / (span + 1), span - 1))
+           for span in np.unique(np.concatenate([ma_long, ma_short]))}
+
+    entry = np.zeros((len(rsi_window), len(close)), dtype=np.int8)
+    valid = np.empty((len(rsi_window), len(close)), dtype=bool)
+    for i in range(len(rsi_window)):
+        r, ml, ms = rsis[rsi_window[i]], mas[ma_long[i]], mas[ma_short[i]]
+        valid[i] = bars & ~np.isnan(r) & ~np.isnan(ml) & ~np.isnan(ms)
+        # 1 if rsi < rsi_long & ma_short > ma_long, -1 if rsi > rsi_short & ma_short < ma_long
+        longs = (r < rsi_long[i]) & (ms > ml)
+        shorts = (r > rsi_short[i]) & (ms < ml)
+        entry[i] = longs.astype(np.int8) - shorts.astype(np.int8)
+        entry[i][~valid[i]] = 0
+    return (entry[0], valid[0]) if single else (entry, valid)
+
+def higher_lower_signals(open, high, low, close, volume):
+    high, low, close = (np.asarray(x, dtype=np.float64) for x in (high, low, close))
+    bars = valid_bars(open, high, low, close, volume)
+    # Values lagged by k bars, NaN before the first bar (comparisons with NaN are False)
+    lag = lambda x, k: np.concatenate([np.full(k, np.nan), x[:-k]])[:len(x)]
+    longs = (high > lag(high, 1)) & (lag(high, 1) > lag(high, 2)) & (lag(close, 2) > lag(high, 3))
+    shorts = (low < lag(low, 1)) & (lag(low, 1) < lag(low, 2)) & (lag(close, 2) < lag(low, 3))
+    entry = longs.astype(np.int8) - shorts.astype(np.int8)
+    entry[~bars] = 0
+    return entry, bars
+
+# -- Replaces the frame of the data manager by its complete bars with their entry, the previous frame is not modified -- #
+def set_signals(system):
+    df = system.dmgt.df
+    params = (getattr(system, p) for p in system.signal_params)
+    entry, valid = system.signals(df.open.values, df.high.values, df.low.values, df.close.values, df.get('volume'), *params)
+    # Like the previous dropna, bars with a missing value in any column are dropped
+    valid &= df.notna().all(axis=1).values
+    system.dmgt.df = df[valid].assign(entry=entry[valid])
 
 class MomentumRSI(Backtest_Traditional):
+    # Parameters of the signals (the other ones are barriers)
+    signal_params = ('rsi_window', 'rsi_long', 'rsi_short', 'ma_long', 'ma_short')
+    signals = staticmethod(momentum_rsi_signals)
+
     def __init__(self, csv_path, date_col, max_holding, ub_mult, lb_mult, rsi_window, rsi_long, rsi_short, ma_long, ma_short):
         super().__init__(csv_path, date_col, max_holding)
 
@@ -15,47 +87,18 @@ class MomentumRSI(Backtest_Traditional):
         self.ma_long = ma_long
         self.ma_short = ma_short
 
-    def calculate_rsi(self):
-        df = self.dmgt.df
-        # Create change column
-        df['change'] = df.close.diff()
-        df['U'] = [x if x > 0 else 0 for x in df.change] # Calculate column of upwards changes
-        df['D'] = [abs(x) if x < 0 else 0 for x in df.change] # Create column of downwards changes
-        df['U'] = df.U.ewm(span=self.rsi_window, min_periods=self.rsi_window-1).mean()
-        df['D'] = df.D.ewm(span=self.rsi_window, min_periods=self.rsi_window - 1).mean()
-        df['RS'] = df.U / df.D
-        df['RSI'] = 100 - 100/(1+df.RS)
-        df.drop(['change', 'U', 'D', 'RS'], axis=1, inplace=True)
-
-    # -- Calculates two expontential movings averages, based on arguments passed into construtor -- #
-    def calculate_ma(self):
-        df = self.dmgt.df
-        df['ma_long'] = df.close.ewm(span=self.ma_long, min_periods=self.ma_long-1).mean()
-        df['ma_short'] = df.close.ewm(span=self.ma_short, min_periods=self.ma_short - 1).mean()
-
     def generate_signals(self):
-        df = self.dmgt.df
-        self.calculate_ma()
-        self.calculate_rsi()
-        df.dropna(inplace=True)
-        # 1 if rsi < 30 & ma_short > ma_long, 0 otherwise
-        df['longs'] = ((df.RSI < self.rsi_long) & (df.ma_short > df.ma_long))*1
-        # -1 if rsi > 70 & ma_short < ma_long, 0 otherwise
-        df['shorts'] = ((df.RSI > self.rsi_short) & (df.ma_short < df.ma_long))*-1
-        df['entry'] = df.longs + df.shorts
-        df.dropna(inplace=True)
-        df = self.dmgt.df
+        set_signals(self)
 
 class HigherLower(Backtest_Traditional):
+    signal_params = ()
+    signals = staticmethod(higher_lower_signals)
+
     def __init__(self, csv_path, date_col, max_holding):
         super().__init__(csv_path, date_col, max_holding)
 
     def generate_signals(self):
-        df = self.dmgt.df
-        df['longs'] = ((df.high > df.high.shift(1)) & (df.high.shift(1) > df.high.shift(2)) & (df.close.shift(2) > df.high.shift(3))) * 1
-        df['shorts'] = ((df.low < df.low.shift(1)) & (df.low.shift(1) < df.low.shift(2)) & (df.close.shift(2) < df.low.shift(3))) * -1
-        df['entry'] = df.shorts + df.longs
-        df.dropna(inplace=True)
+        set_signals(self)
 
 if __name__ == '__main__':
     # Universal parameters
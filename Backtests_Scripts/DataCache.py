@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+import shutil
+import numpy as np
+import pandas as pd
+
+# ---- Columnar binary cache of the csv files ---- #
+# The first time a csv is loaded every column is saved as a .npy file (datetimes as int64 nanoseconds since epoch)
+# in a <csv_path>.cache folder (one subfolder per set of read options). The next loads memory-map the .npy files
+# instead of parsing the csv and its dates.
+# The cache is rebuilt automatically when the size or the modification time of the csv change.
+# Loads can be restricted to a date range and to some columns, only that part of the files is read.
+
+CACHE_VERSION = 2
+
+# -- Path of the cache folder of a csv read with the given options -- #
+def cache_dir(csv_path, options):
+    digest = hashlib.md5(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(f"{csv_path}.cache", digest)
+
+# -- Fingerprint of the source csv and of the options used to read it, the cache is valid only if it matches -- #
+def source_key(csv_path, options):
+    stat = os.stat(csv_path)
+    return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'options': options}
+
+# -- Saves every column of df as a .npy file in the folder path, together with the key identifying its source -- #
+def save_frame(path, df, key, date_cols):
+    meta = {'key': key, 'n_rows': len(df), 'columns': []}
+    tmp = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for i, col in enumerate(df.columns):
+        if col in date_cols:
+            values = pd.to_datetime(df[col]).values.astype('datetime64[ns]').view(np.int64)
+            kind = 'datetime'
+            # Sorted timestamps allow to find a date range with a binary search
+            meta.setdefault('sorted', {})[col] = bool(np.all(values[1:] >= values[:-1]))
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            values = df[col].values
+            kind = 'numeric'
+        else:
+            values = df[col].astype(str).values.astype(str)
+            kind = 'string'
+        np.save(os.path.join(tmp, f"{i}.npy"), values)
+        meta['columns'].append({'name': col, 'file': f"{i}.npy", 'kind': kind})
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    # Replace the previous cache only once the new one is complete
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return meta
+
+# -- Reads the csv with pandas and saves every column in the cache folder -- #
+def build_cache(csv_path, date_cols, na_values, key):
+    df = pd.read_csv(csv_path, na_values=na_values)
+    return save_frame(cache_dir(csv_path, key['options']), df, key, date_cols)
+
+# -- Returns the metadata of a valid cache, None if it is missing or out of date -- #
+def read_meta(csv_path, key):
+    meta_path = os.path.join(cache_dir(csv_path, key['options']), 'meta.json')
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['key'] != key:
+        return None
+    return meta
+
+# -- Memory-maps a column of the cache, copy-on-write so the caller can modify it without touching the file -- #
+def load_column(path, column):
+    values = np.load(os.path.join(path, column['file']), mmap_mode='c')
+    if column['kind'] == 'datetime':
+        values = values.view('datetime64[ns]')
+    return values
+
+# -- Converts a start/end date to int64 nanoseconds, None stays None -- #
+def to_ns(date):
+    if date is None:
+        return None
+    return pd.Timestamp(date).to_datetime64().astype('datetime64[ns]').view(np.int64)
+
+# -- Rows between start and end (both included) of the timestamps, as a slice if they are sorted or a boolean mask otherwise -- #
+def range_rows(timestamps, start, end, is_sorted):
+    start, end = to_ns(start), to_ns(end)
+    if is_sorted:
+        i0 = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+        i1 = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='right')
+        return slice(i0, i1)
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps <= end
+    return mask
+
+# -- Plain pandas version of read_csv_cached, used when the cache is disabled or cannot be written -- #
+def read_csv_range(csv_path, date_cols=(), index_col=None, na_values=None, start=None, end=None, columns=None):
+    range_col = index_col if index_col is not None else (date_cols[0] if date_cols else None)
+    usecols = None if columns is None else list(dict.fromkeys(list(columns) + ([range_col] if range_col else [])))
+    df = pd.read_csv(csv_path, na_values=na_values, parse_dates=list(date_cols), usecols=usecols)
+    if range_col is not None and (start is not None or end is not None):
+        timestamps = df[range_col].values.astype('datetime64[ns]').view(np.int64)
+        df = df[range_rows(timestamps, start, end, False)].reset_index(drop=True)
+    if index_col is not None:
+        df = df.set_index(index_col)
+    return df
+
+# -- Same as pd.read_csv(csv_path, na_values=na_values, parse_dates=date_cols, index_col=index_col) but served from the cache -- #
+# start/end restrict the rows to a date range of the index_col (or of the first date column), columns to a subset of the columns
+def read_csv_cached(csv_path, date_cols=(), index_col=None, na_values=None, start=None, end=None, columns=None):
+    options = {'date_cols': sorted(date_cols), 'na_values': na_values}
+    key = source_key(csv_path, options)
+    meta = read_meta(csv_path, key)
+    if meta is None:
+        try:
+            meta = build_cache(csv_path, set(date_cols), na_values, key)
+        except OSError:
+            # The cache cannot be written (e.g. read-only folder), fall back to the csv
+            return read_csv_range(csv_path, date_cols, index_col, na_values, start, end, columns)
+    path = cache_dir(csv_path, options)
+    by_name = {column['name']: column for column in meta['columns']}
+    range_col = index_col if index_col is not None else (date_cols[0] if date_cols else None)
+    wanted = set(by_name) if columns is None else set(columns) | ({range_col} if range_col else set())
+    missing = wanted - set(by_name)
+    if missing:
+        raise ValueError(f'Columns {sorted(missing)} not in {csv_path}')
+    # Same order as in the csv
+    names = [name for name in by_name if name in wanted]
+
+    rows = None
+    if range_col is not None and (start is not None or end is not None):
+        timestamps = load_column(path, by_name[range_col]).view(np.int64)
+        rows = range_rows(timestamps, start, end, meta.get('sorted', {}).get(range_col, False))
+    data = {}
+    for name in names:
+        values = load_column(path, by_name[name])
+        # Only the selected rows of the memory-mapped columns are copied in memory
+        data[name] = values if rows is None else np.array(values[rows])
+    df = pd.DataFrame(data, copy=False)
+    if index_col is not None:
+        df = df.set_index(index_col)
+    return df
+
+# -- Saves a frame derived from a csv (e.g. resampled bars) next to its cache, options must identify how it was derived -- #
+def save_derived(csv_path, options, df):
+    key = source_key(csv_path, options)
+    df = df.reset_index()
+    save_frame(cache_dir(csv_path, options), df, key, {df.columns[0]})
+
+# -- Loads a frame saved by save_derived, None if it is missing or the csv changed since -- #
+def load_derived(csv_path, options):
+    key = source_key(csv_path, options)
+    meta = read_meta(csv_path, key)
+    if meta is None:
+        return None
+    path = cache_dir(csv_path, options)
+    df = pd.DataFrame({column['name']: load_column(path, column) for column in meta['columns']}, copy=False)
+    return df.set_index(df.columns[0])
@@ -0,0 +1,54 @@
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import get_technical_indicators, feature_matrix, valid_features, FEATURES
+
+# ---- Compares the pandas get_technical_indicators pipeline with the numpy feature_matrix builder ---- #
+
+# -- Random walk 1-minute bars with the columns used by the LSTM -- #
+def synthetic_bars(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 40_000 * np.exp(np.cumsum(rng.normal(0, 1e-3, n_rows)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2021-01-01', periods=n_rows, freq='1min'),
+        'open': open_,
+        'low': np.minimum(open_, close) * 0.999,
+        'high': np.maximum(open_, close) * 1.001,
+        'close': close,
+        'volume': rng.uniform(1, 100, n_rows),
+    })
+
+# -- Previous pipeline: indicators added as columns, reordered, dropna and converted to the model input -- #
+def pandas_features(bars):
+    df = get_technical_indicators(bars.copy())
+    df = df.reindex(columns=['timestamp', 'open', 'low', 'high', 'close', 'volume'] + [f for f in FEATURES if f not in bars.columns])
+    df = df.dropna()
+    return df[FEATURES].to_numpy(dtype=np.float32)
+
+def numpy_features(bars):
+    X = feature_matrix(bars.open.values, bars.high.values, bars.low.values, bars.volume.values)
+    return valid_features(X)[0]
+
+# -- Runs fn(bars) and returns its result, the time taken and the peak of the memory allocated (measured on a second run) -- #
+def measure(fn, bars):
+    t = time.perf_counter()
+    result = fn(bars)
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn(bars)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    bars = synthetic_bars(n_rows)
+    X_pandas, t_pandas, m_pandas = measure(pandas_features, bars)
+    X_numpy, t_numpy, m_numpy = measure(numpy_features, bars)
+    # Same rows, values equal up to the float32 rounding
+    np.testing.assert_allclose(X_numpy, X_pandas, rtol=1e-6, atol=1e-6)
+    print(f"{n_rows:,} rows | pandas {t_pandas:6.2f}s {m_pandas / 2**20:7.0f} MiB | numpy {t_numpy:6.2f}s {m_numpy / 2**20:7.0f} MiB | speed-up x{t_pandas / t_numpy:.1f} | parity ok")
@@ -0,0 +1,188 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from DataCache import cache_dir, source_key
+from Datamanager import DataManager_LSTM
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import feature_graph, FEATURES
+
+# ---- Memory-mapped store of the feature matrix of a history ---- #
+# The features of every bar of the history are computed once and saved as a raw float32 (n, n_features) file
+# with an int64 timestamp index next to the csv cache (one folder per feature set). When bars are appended to the
+# history only the new ones are computed, continuing from the saved state of the indicators. Readers memory-map the
+# files and take slices of them without loading the whole matrix.
+# meta.json is written last and is the commit of an update: it gives the number of valid rows and the name of the state
+# file of that row (state.<n_rows>.pkl), so an update interrupted before it leaves the previous store intact. A full rebuild
+# replaces the files instead of truncating them, the memory maps already opened keep reading the previous ones.
+# Bump FEATURES_VERSION when the definition of a feature changes, the stores are then rebuilt.
+
+FEATURES_VERSION = 1
+
+# -- Validated bars of the LSTM: kept columns in order, datetime timestamps and no duplicated timestamp -- #
+def validate_bars(data):
+    # Copy only the columns that are kept instead of the whole dataframe
+    columns_titles = ['timestamp','open','low','high','close','volume','t_plus']
+    df = data.reindex(columns=columns_titles)
+    # Change timestamp column to datetime
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    # Drop duplicates
+    df.drop_duplicates(subset=['timestamp'], keep='first', inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+class FeatureStore:
+    def __init__(self, path, features=FEATURES):
+        self.path = path
+        self.features = list(features)
+        self.graph = feature_graph(self.features)
+        self.csv_path = None
+        self.meta = self.read_meta()
+
+    # -- Store of the features of a csv of 1-minute bars, in its cache folder -- #
+    @classmethod
+    def for_csv(cls, csv_path, features=FEATURES):
+        options = {'feature_store': list(features), 'version': FEATURES_VERSION}
+        store = cls(cache_dir(csv_path, options), features)
+        store.csv_path = csv_path
+        return store
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def read_meta(self):
+        if not os.path.isfile(self.file('meta.json')):
+            return None
+        with open(self.file('meta.json')) as f:
+            meta = json.load(f)
+        # A meta without the name of its state file was written before the state was committed with it, the store is rebuilt
+        valid = meta['features'] == self.features and meta['version'] == FEATURES_VERSION and 'state' in meta
+        return meta if valid else None
+
+    # -- Writes a file by replacing it once it is complete -- #
+    def replace(self, name, write, mode='w'):
+        tmp = self.file(f'{name}.tmp{os.getpid()}')
+        with open(tmp, mode) as f:
+            write(f)
+        os.replace(tmp, self.file(name))
+
+    def __len__(self):
+        return 0 if self.meta is None else self.meta['n_rows']
+
+    # -- Hash of the first n bars, the saved features are only extended if the history starts with the same bars -- #
+    def fingerprint(self, timestamps, inputs, n):
+        digest = hashlib.md5(np.ascontiguousarray(timestamps[:n]).tobytes())
+        for values in inputs:
+            digest.update(np.ascontiguousarray(values[:n]).tobytes())
+        return digest.hexdigest()
+
+    # -- Brings the store up to date with the bars (a mapping with the graph inputs), returns the number of rows computed -- #
+    # source identifies where the bars come from (e.g. the size and mtime of the csv) and is saved in the meta
+    def update(self, timestamps, bars, source=None):
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]').view(np.int64)
+        inputs = [np.asarray(bars[col], dtype=np.float64) for col in self.graph.inputs]
+        n_old = len(self)
+        n = len(timestamps)
+        if n_old and n >= n_old and self.fingerprint(timestamps, inputs, n_old) == self.meta['fingerprint']:
+            if n == n_old:
+                if source != self.meta.get('source'):
+                    self.commit(dict(self.meta, source=source))
+                return 0
+            # Only the new bars are computed, the indicators continue from the saved state
+            start = n_old
+            with open(self.file(self.meta['state']), 'rb') as f:
+                state = pickle.load(f)
+        else:
+            start = 0
+            state = self.graph.state()
+            # The previous store is invalid from the moment its files are replaced
+            if self.meta is not None:
+                os.remove(self.file('meta.json'))
+                self.meta = None
+        os.makedirs(self.path, exist_ok=True)
+        tail = self.graph.compute({col: values[start:] for col, values in zip(self.graph.inputs, inputs)}, state=state)
+
+        for name, values, width in (('features.f32', tail, 4 * len(self.features)), ('index.i64', timestamps[start:], 8)):
+            if start:
+                # Rows written after the last complete update (e.g. interrupted) are discarded before appending
+                with open(self.file(name), 'r+b') as f:
+                    f.truncate(start * width)
+                    f.seek(start * width)
+                    f.write(np.ascontiguousarray(values).tobytes())
+            else:
+                self.replace(name, lambda f: f.write(np.ascontiguousarray(values).tobytes()), 'wb')
+        self.replace(f'state.{n}.pkl', lambda f: pickle.dump(state, f), 'wb')
+        self.commit({
+            'features': self.features,
+            'version': FEATURES_VERSION,
+            'n_rows': n,
+            'state': f'state.{n}.pkl',
+            'lookback': self.graph.lookback,
+            'fingerprint': self.fingerprint(timestamps, inputs, n),
+            'sorted': bool(np.all(timestamps[1:] >= timestamps[:-1])),
+            'source': source,
+        })
+        return n - start
+
+    # -- Writes the meta of an update, then removes the state files of the previous ones -- #
+    def commit(self, meta):
+        self.replace('meta.json', lambda f: json.dump(meta, f))
+        self.meta = meta
+        for name in os.listdir(self.path):
+            if name.startswith('state.') and name.endswith('.pkl') and name != meta['state']:
+                os.remove(self.file(name))
+
+    # -- Brings the store of a csv up to date with the bars of DataManager_LSTM on the whole csv -- #
+    # The csv is only loaded when its size or modification time changed since the last sync
+    def sync(self):
+        if self.csv_path is None:
+            raise ValueError('Only a store made with FeatureStore.for_csv can be synced')
+        source = source_key(self.csv_path, None)
+        if self.meta is not None and self.meta.get('source') == source:
+            return 0
+        df = validate_bars(DataManager_LSTM(self.csv_path).df)
+        return self.update(df.timestamp.values, df, source)
+
+    # -- Memory-mapped (read-only) timestamps of the rows -- #
+    @property
+    def index(self):
+        if not len(self):
+            return np.empty(0, dtype='datetime64[ns]')
+        return np.memmap(self.file('index.i64'), dtype=np.int64, mode='r', shape=(len(self),)).view('datetime64[ns]')
+
+    # -- Memory-mapped (read-only) feature matrix, rows before the lookback of the history contain NaN -- #
+    @property
+    def matrix(self):
+        if not len(self):
+            return np.empty((0, len(self.features)), dtype=np.float32)
+        return np.memmap(self.file('features.f32'), dtype=np.float32, mode='r', shape=(len(self), len(self.features)))
+
+    # -- Timestamps and features of the rows between start and end (both included), views of the files -- #
+    def slice(self, start=None, end=None):
+        index = self.index
+        if not self.meta['sorted']:
+            raise ValueError('The timestamps of the store are not sorted')
+        i0 = 0 if start is None else np.searchsorted(index, np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+        i1 = len(index) if end is None else np.searchsorted(index, np.datetime64(pd.Timestamp(end), 'ns'), side='right')
+        return index[i0:i1], self.matrix[i0:i1]
+
+    # -- Features of the bars at the given timestamps, a view of the file when they are consecutive rows of the store -- #
+    def rows(self, timestamps):
+        index = self.index
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]')
+        pos = np.searchsorted(index, timestamps) if self.meta['sorted'] else None
+        if pos is None or (pos >= len(index)).any() or (index[np.minimum(pos, len(index) - 1)] != timestamps).any():
+            raise ValueError('Some timestamps are not in the feature store, sync it first')
+        if len(pos) and pos[-1] - pos[0] == len(pos) - 1:
+            return self.matrix[pos[0]:pos[-1] + 1]
+        return self.matrix[pos]
+
+if __name__ == '__main__':
+    csv_path = '../Data/BPF_testset_1min.csv'
+
+    store = FeatureStore.for_csv(csv_path)
+    print(f"{store.sync()} rows computed, {len(store)} in the store")
+    index, X = store.slice('2022-01-01', '2022-01-31')
+    print(f"January 2022: {X.shape[0]} rows of {X.shape[1]} features")
@@ -0,0 +1,134 @@
+import inspect
+import numpy as np
+import pandas as pd
+from Datamanager import DataManager_Traditional
+from BacktestStatistics import BacktestProfile, profile_metrics
+from TripleBarrier import triple_barrier, trade_columns
+from Backtest_Traditional import MomentumRSI, HigherLower
+
+# ---- Backtest of several strategies on the same bars ---- #
+# The bars are loaded (and resampled) once, the indicators requested by the strategies are computed once and shared,
+# then every strategy is evaluated by the triple barrier engine with its own position state and result columns.
+
+class MultiStrategyBacktest:
+    def __init__(self, csv_path, date_col, timeframe='1min'):
+        # csv_path can also be an already loaded DataManager_Traditional
+        if isinstance(csv_path, DataManager_Traditional):
+            self.dmgt = csv_path
+        else:
+            self.dmgt = DataManager_Traditional(csv_path, date_col)
+        if timeframe != self.dmgt.timeframe:
+            self.dmgt.change_resolution(timeframe)
+        # The strategies see the resampled bars like in Backtest_Traditional (including empty bins), the engine only the complete ones
+        self.frame = self.dmgt.df
+        self.bars = self.frame.dropna()
+        self.timeframe = timeframe
+        self.indicators = {}
+        self.strategies = {}
+        self.results = None
+
+    # -- Returns the indicator called name, computed with fn(bars) the first time it is requested and shared afterwards -- #
+    def indicator(self, name, fn):
+        if name not in self.indicators:
+            self.indicators[name] = fn(self.bars)
+        return self.indicators[name]
+
+    # -- Registers a strategy: signal_fn(backtest) returns the entry column (1 long, -1 short, 0 nothing) of the bars -- #
+    def register(self, name, signal_fn, max_holding, ub_mult=1.03, lb_mult=0.97):
+        if name in self.strategies:
+            raise ValueError(f'Strategy {name} already registered')
+        self.strategies[name] = {'signal_fn': signal_fn, 'max_holding': max_holding, 'ub_mult': ub_mult, 'lb_mult': lb_mult}
+
+    # -- Registers a Backtest_Traditional subclass through its pure signal function, run on the arrays of the shared bars -- #
+    # Its indicators (e.g. the RSI and moving averages of MomentumRSI) are requested through indicator(), so the strategies
+    # using the same ones compute them once. params has the signal parameters of the strategy and its barriers.
+    def register_strategy(self, name, strategy, params):
+        barriers = ('max_holding', 'ub_mult', 'lb_mult')
+        unknown = set(params) - set(strategy.signal_params) - set(barriers)
+        missing = set(strategy.signal_params + ('max_holding',)) - set(params)
+        if unknown or missing:
+            raise ValueError(f'{strategy.__name__}: unknown parameters {sorted(unknown)}, missing parameters {sorted(missing)}')
+        signal_params = [params[p] for p in strategy.signal_params]
+        shared = 'indicator' in inspect.signature(strategy.signals).parameters
+
+        def signals(bt):
+            frame = bt.frame
+            # Like in Backtest_Traditional the indicators are computed on the bars with the empty bins, the suffix keeps
+            # them apart from the indicators of the complete bars
+            kwargs = {'indicator': lambda key, fn: bt.indicator(f'{key}_frame', lambda bars: fn())} if shared else {}
+            entry, _ = strategy.signals(frame.open.values, frame.high.values, frame.low.values, frame.close.values, frame.get('volume'),
+                                        *signal_params, **kwargs)
+            # The complete bars are the rows kept by set_signals, the entry is already 0 where an indicator is missing
+            return entry[frame.notna().all(axis=1).values]
+        self.register(name, signals, params['max_holding'], params.get('ub_mult', 1.03), params.get('lb_mult', 0.97))
+
+    # -- Registers an LSTM backtest of Backtest_LSTM, its signals are LSTM.signals of the predictions of the system -- #
+    # The predictions go through the prediction cache of the system, so the models only run on bars they never predicted.
+    # The barriers default to the ones of the system.
+    def register_lstm(self, name, system, max_holding=None, ub_mult=None, lb_mult=None):
+        if self.timeframe != '1min':
+            raise ValueError(f'The LSTM models predict 1-minute bars, the backtest timeframe is {self.timeframe}')
+
+        def signals(bt):
+            data, _, res = system.predict()
+            entry = pd.Series(system.signals(res), index=pd.DatetimeIndex(data.timestamp.values))
+            # Bars without a prediction (warm-up of the features, last bar) have no signal
+            return entry.reindex(bt.bars.index).fillna(0).values.astype(np.int8)
+        self.register(name, signals,
+                      system.max_holding_limit if max_holding is None else max_holding,
+                      system.ub_mult if ub_mult is None else ub_mult,
+                      system.lb_mult if lb_mult is None else lb_mult)
+
+    # -- Runs all the registered strategies, the results have <name>_entry/_returns/_holding/_direction columns -- #
+    def run_backtest(self):
+        bars = self.bars
+        close = bars.close.values.astype(np.float64)
+        t_plus = bars.t_plus.values.astype(np.float64)
+        # Special case of vertical barrier, same end date as Backtest_Traditional
+        at_end = bars.index.values == self.dmgt.data.index.values[-1]
+        results = {}
+        for name, strat in self.strategies.items():
+            entry = np.asarray(strat['signal_fn'](self))
+            trades = triple_barrier(entry, t_plus, close, at_end, strat['ub_mult'], strat['lb_mult'], strat['max_holding'])
+            results[f'{name}_entry'] = entry
+            for col, values in trade_columns(trades, len(bars)).items():
+                results[f'{name}_{col}'] = values
+        self.results = pd.DataFrame(results, index=bars.index)
+        return self.results
+
+    # -- Backtest of a single strategy in the same format as Backtest_Traditional (entry, returns, holding, direction) -- #
+    def strategy_backtest(self, name):
+        cols = ['entry', 'returns', 'holding', 'direction']
+        bt = self.bars.copy()
+        for col in cols:
+            bt[col] = self.results[f'{name}_{col}'].values
+        return bt
+
+    # -- One row of BacktestProfile metrics per strategy -- #
+    def profiles(self):
+        rows = []
+        for name in self.strategies:
+            bt = self.strategy_backtest(name).rename_axis('timestamp').reset_index()
+            rows.append(dict(strategy=name, **profile_metrics(BacktestProfile(bt, self.timeframe))))
+        return pd.DataFrame(rows).set_index('strategy')
+
+if __name__ == '__main__':
+    csv_path = '../Data/BPF_testset_1min.csv'
+    date_col = 'timestamp'
+
+    bt = MultiStrategyBacktest(csv_path, date_col, timeframe='20min')
+    bt.register_strategy('momentum_rsi', MomentumRSI, {'max_holding': 55, 'ub_mult': 1.03, 'lb_mult': 0.97, 'rsi_window': 14,
+                                                       'rsi_long': 30, 'rsi_short': 70, 'ma_long': 26, 'ma_short': 12})
+    bt.register_strategy('higher_lower', HigherLower, {'max_holding': 55})
+    # Custom strategy on shared indicators: long when the close crosses above its 50 bars EMA, short when it crosses below
+    ema_50 = lambda bars: bars.close.ewm(span=50, min_periods=49).mean()
+    def ema_cross(bt):
+        above = (bt.bars.close > bt.indicator('ema_50', ema_50)).astype(int)
+        return above.diff().fillna(0).values
+    bt.register('ema_cross', ema_cross, 55)
+    # LSTM on the same bars, only with timeframe='1min' (the predictions are read from the prediction cache when possible)
+    #from Backtest_LSTM import LSTM
+    #bt.register_lstm('lstm', LSTM(csv_path, 55, entry_cond=0.03))
+
+    bt.run_backtest()
+    print(bt.profiles())
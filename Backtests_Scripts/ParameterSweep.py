@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import inspect
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from Datamanager import DataManager_Traditional
+from BacktestStatistics import BacktestProfile, LedgerProfile, profile_metrics
+from TripleBarrier import triple_barrier, TradeLedger
+from Backtest_Traditional import MomentumRSI, HigherLower
+
+# ---- Parallel parameter sweep for the traditional strategies ---- #
+# The OHLCV data is read once in the main process and copied into shared memory blocks,
+# the worker processes attach to them and build their DataFrame on top without copying the data.
+
+# Shared data of the worker process, set by attach_shared_data
+_shared = {}
+
+# -- Expands a grid {param: [values]} into the list of all the parameter combinations -- #
+def expand_grid(param_grid):
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+
+# -- Copies the data of a DataManager_Traditional into shared memory, returns the blocks and their description -- #
+def share_data(data):
+    values = data.to_numpy(dtype=np.float64)
+    index = data.index.values.astype('datetime64[ns]').view(np.int64)
+    values_shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    index_shm = shared_memory.SharedMemory(create=True, size=max(index.nbytes, 1))
+    np.ndarray(values.shape, dtype=np.float64, buffer=values_shm.buf)[:] = values
+    np.ndarray(index.shape, dtype=np.int64, buffer=index_shm.buf)[:] = index
+    spec = {
+        'values': values_shm.name,
+        'index': index_shm.name,
+        'shape': values.shape,
+        'columns': list(data.columns),
+        'index_name': data.index.name,
+    }
+    return [values_shm, index_shm], spec
+
+# -- Worker initializer: attaches to the shared blocks and wraps them in a read-only DataFrame -- #
+def attach_shared_data(spec):
+    values_shm = shared_memory.SharedMemory(name=spec['values'])
+    index_shm = shared_memory.SharedMemory(name=spec['index'])
+    values = np.ndarray(spec['shape'], dtype=np.float64, buffer=values_shm.buf)
+    index = np.ndarray(spec['shape'][:1], dtype=np.int64, buffer=index_shm.buf)
+    # The strategies only add columns, writing into the shared data would corrupt it for the other workers
+    values.flags.writeable = False
+    index.flags.writeable = False
+    index = pd.DatetimeIndex(index.view('datetime64[ns]'), name=spec['index_name'])
+    _shared['blocks'] = [values_shm, index_shm]
+    _shared['data'] = pd.DataFrame(values, index=index, columns=spec['columns'], copy=False)
+    # Resampled bars memoised by the worker and reused by all its backtests
+    _shared['resolutions'] = {}
+
+# -- Builds the strategy on a data manager, parameters of the constructor are passed to it and the other ones (e.g. ub_mult of HigherLower) are set as attributes -- #
+def build_strategy(strategy, dmgt, params):
+    accepted = inspect.signature(strategy.__init__).parameters
+    kwargs = {k: v for k, v in params.items() if k in accepted}
+    system = strategy(dmgt, None, **kwargs)
+    for k, v in params.items():
+        if k in accepted:
+            continue
+        if not hasattr(system, k):
+            raise ValueError(f'{strategy.__name__} has no parameter {k}')
+        setattr(system, k, v)
+    return system
+
+# -- Runs one backtest on the shared data and returns its parameters with the BacktestProfile metrics -- #
+def run_single(strategy, params, timeframe, engine):
+    dmgt = DataManager_Traditional.from_data(_shared['data'], resolutions=_shared['resolutions'])
+    if timeframe != '1min':
+        dmgt.change_resolution(timeframe)
+    system = build_strategy(strategy, dmgt, params)
+    system.run_backtest(engine=engine)
+
+    if engine == 'ledger':
+        # Statistics straight from the trades, the per-bar result columns are never built
+        profile = LedgerProfile(system.ledger, timeframe)
+    else:
+        bt = system.dmgt.df.rename_axis('timestamp').reset_index()
+        profile = BacktestProfile(bt, timeframe)
+    return dict(params, timeframe=timeframe, **profile_metrics(profile))
+
+# -- Sweeps a strategy over every combination of param_grid, in parallel over n_workers processes (all cores by default) -- #
+def parameter_sweep(strategy, csv_path, date_col, param_grid, timeframe='1min', n_workers=None, engine='ledger'):
+    data = DataManager_Traditional(csv_path, date_col).data
+    combinations = expand_grid(param_grid)
+    n_workers = n_workers or os.cpu_count()
+    blocks, spec = share_data(data)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_shared_data, initargs=(spec,)) as pool:
+            n = len(combinations)
+            results = list(pool.map(run_single, [strategy] * n, combinations, [timeframe] * n, [engine] * n,
+                                    chunksize=max(1, n // (n_workers * 4))))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return pd.DataFrame(results)
+
+# -- Sweeps entry_cond and the barriers of an LSTM backtest, the model runs at most once (its predictions are cached on disk) -- #
+# Parameters missing from param_grid keep the values of the system
+def lstm_parameter_sweep(system, param_grid):
+    data, pred, res = system.predict()
+    res = np.asarray(res).reshape(-1)
+    close = data.close.values
+    t_plus = data.t_plus.values
+    at_end = data.index.values == system.end_date
+    defaults = {'entry_cond': system.entry_cond, 'ub_mult': system.ub_mult, 'lb_mult': system.lb_mult, 'max_holding': system.max_holding_limit}
+    entries = {}
+    results = []
+    for params in expand_grid(param_grid):
+        p = dict(defaults, **params)
+        if p['entry_cond'] not in entries:
+            entries[p['entry_cond']] = 1 * (res > p['entry_cond']) - 1 * (res < -p['entry_cond'])
+        trades = triple_barrier(entries[p['entry_cond']], t_plus, close, at_end, p['ub_mult'], p['lb_mult'], p['max_holding'])
+        profile = LedgerProfile(TradeLedger(trades, data.index), system.dmgt.timeframe)
+        results.append(dict(params, **profile_metrics(profile)))
+    return pd.DataFrame(results)
+
+# -- Times the same sweep for each number of workers on synthetic bars, prints the backtests per second and the speed-up over the first count -- #
+def worker_scaling(strategy, param_grid, worker_counts, n_rows=500_000, timeframe='20min'):
+    from BacktestBenchmark import synthetic_csv
+    n = len(expand_grid(param_grid))
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'synthetic.csv')
+        synthetic_csv(csv_path, n_rows)
+        # Fills the binary cache of the csv, the timed sweeps only read it
+        DataManager_Traditional(csv_path, 'timestamp')
+        base = None
+        for n_workers in worker_counts:
+            t = time.perf_counter()
+            parameter_sweep(strategy, csv_path, 'timestamp', param_grid, timeframe=timeframe, n_workers=n_workers)
+            rate = n / (time.perf_counter() - t)
+            base = base or rate
+            print(f'{n_workers:>3} workers | {n} backtests | {rate:7.2f} backtests/s | speed-up x{rate / base:.2f}')
+
+if __name__ == '__main__':
+    csv_path = '../Data/BPF_testset_1min.csv'
+    date_col = 'timestamp'
+
+    # Every combination of the grid is backtested
+    param_grid = {
+        'max_holding': [25, 55],
+        'ub_mult': [1.01, 1.03],
+        'lb_mult': [0.99, 0.97],
+        'rsi_window': [9, 14],
+        'rsi_long': [25, 30],
+        'rsi_short': [70, 75],
+        'ma_long': [26],
+        'ma_short': [12],
+    }
+
+    # --workers 1,2,4 only times the MomentumRSI sweep on synthetic bars for each number of workers
+    if '--workers' in sys.argv:
+        worker_counts = [int(n) for n in sys.argv[sys.argv.index('--workers') + 1].split(',')]
+        print(f'{os.cpu_count()} cores')
+        worker_scaling(MomentumRSI, param_grid, worker_counts)
+        sys.exit()
+
+    results = parameter_sweep(MomentumRSI, csv_path, date_col, param_grid, timeframe='20min')
+    print(results.sort_values('sharpe', ascending=False).head(10))
+
+    results = parameter_sweep(HigherLower, csv_path, date_col, {'max_holding': [10, 25, 55]}, timeframe='120min')
+    print(results)
+
+    # The LSTM predictions are computed (or read from the cache) once for the whole grid
+    from Backtest_LSTM import LSTM
+    lstm_grid = {'entry_cond': [0.01, 0.02, 0.03], 'ub_mult': [1.01, 1.03], 'lb_mult': [0.99, 0.97], 'max_holding': [25, 55]}
+    results = lstm_parameter_sweep(LSTM(csv_path, 55), lstm_grid)
+    print(results.sort_values('sharpe', ascending=False).head(10))
@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import feature_graph, FEATURES
+from FeatureStore import FEATURES_VERSION
+
+# ---- On-disk cache of the LSTM predictions ---- #
+# The predictions only depend on the model, on its scaler and on the bars, so they are saved once per (model file hash,
+# scaler file hash, data version) in a folder of PREDICTIONS_DIR. The next backtests on the same bars (e.g. with another
+# entry_cond or other barriers) read them instead of computing the features and running the model again.
+
+PREDICTIONS_DIR = '../Backtests_Data/predictions'
+
+# Hashes of the files already read, by path and (size, modification time)
+_file_hashes = {}
+
+# -- md5 of the content of a file, memoised until the file changes -- #
+def file_hash(path):
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+# -- Hash of the validated bars (timestamps and inputs of the features) -- #
+def data_version(bars, features=FEATURES):
+    digest = hashlib.md5(np.ascontiguousarray(bars.timestamp.values.astype('datetime64[ns]')).tobytes())
+    for col in feature_graph(features).inputs:
+        digest.update(np.ascontiguousarray(bars[col].values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+class PredictionCache:
+    def __init__(self, path=PREDICTIONS_DIR):
+        self.path = path
+
+    # -- Key of the predictions of a ModelVersion on validated bars -- #
+    def key(self, model, bars):
+        key = {
+            'model': file_hash(model.model_path),
+            'scaler': file_hash(model.scaler_path),
+            'data': data_version(bars),
+            'features': FEATURES_VERSION,
+        }
+        return hashlib.md5(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def folder(self, key):
+        return os.path.join(self.path, key)
+
+    # -- Positions (in the validated bars) of the predicted rows and their predictions, None if they are not cached -- #
+    def load(self, key):
+        folder = self.folder(key)
+        try:
+            return np.load(os.path.join(folder, 'rows.npy')), np.load(os.path.join(folder, 'pred.npy'))
+        except OSError:
+            return None
+
+    def save(self, key, rows, pred):
+        folder = self.folder(key)
+        tmp = f'{folder}.tmp{os.getpid()}'
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, 'rows.npy'), np.asarray(rows, dtype=np.int64))
+        np.save(os.path.join(tmp, 'pred.npy'), np.asarray(pred, dtype=np.float32))
+        # Replace a previous entry only once the new one is complete
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp, folder)
+
+    # -- Removes all the cached predictions -- #
+    def clear(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
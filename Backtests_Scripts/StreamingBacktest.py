@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from Datamanager import DataManager_Traditional
+from ParameterSweep import build_strategy
+from TripleBarrier import triple_barrier, trade_columns
+from Backtest_Traditional import HigherLower
+
+# ---- Backtest on a stream of chunks of bars, for histories that do not fit in memory ---- #
+# Only the current chunk, the next one (needed for t_plus and to know where the history ends) and a few warm-up bars
+# for the indicators are in memory. The open position is carried from one chunk to the next and the results are
+# appended to a csv after every chunk.
+
+# -- Reads a csv in chunks of chunksize rows indexed by the date column -- #
+def csv_chunks(csv_path, date_col, chunksize=1_000_000):
+    for chunk in pd.read_csv(csv_path, parse_dates=[date_col], index_col=date_col, chunksize=chunksize):
+        yield chunk
+
+# -- Reads a parquet file in batches of batch_size rows indexed by the date column (needs pyarrow) -- #
+def parquet_chunks(parquet_path, date_col, batch_size=1_000_000):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=batch_size):
+        yield batch.to_pandas().set_index(date_col)
+
+# -- Signal function running the generate_signals of a Backtest_Traditional subclass on a chunk -- #
+def strategy_signals(strategy, params):
+    def signals(frame):
+        system = build_strategy(strategy, DataManager_Traditional.from_data(frame), params)
+        system.generate_signals()
+        return system.dmgt.df.entry.reindex(frame.index).fillna(0).values
+    return signals
+
+class StreamingBacktest:
+    # signal_fn receives the bars of a chunk preceded by `warmup` bars of the previous one and returns the entry column
+    def __init__(self, signal_fn, maximum_holding, ub_mult=1.03, lb_mult=0.97, warmup=100):
+        self.signal_fn = signal_fn
+        self.max_holding_limit = maximum_holding
+        self.ub_mult = ub_mult
+        self.lb_mult = lb_mult
+        self.warmup = warmup
+        # Open position carried between chunks
+        self.open_pos = False
+        self.entry_price = None
+        self.direction = None
+        self.elapsed = 0 # Bars monitored since the entry
+        # Totals of the whole stream
+        self.n_bars = 0
+        self.n_trades = 0
+        self.sum_returns = 0
+
+    # -- Closes (or keeps carrying) the position opened in a previous chunk, returns the first bar free for a new trade -- #
+    def resolve_open_position(self, close, at_end, cols):
+        width = self.max_holding_limit - self.elapsed + 1
+        prices = close[:width]
+        hit = (prices >= self.entry_price * self.ub_mult) | (prices <= self.entry_price * self.lb_mult) | at_end[:width]
+        # Vertical barrier on the bar where max_holding bars have passed
+        if width <= len(close):
+            hit[width - 1] = True
+        if not hit.any():
+            self.elapsed += len(close)
+            return len(close)
+        j = int(hit.argmax())
+        cols['returns'][j] = (close[j] / self.entry_price - 1) * self.direction
+        cols['holding'][j] = self.elapsed + j
+        cols['direction'][j] = self.direction
+        self.n_trades += 1
+        self.open_pos = False
+        return j + 1
+
+    # -- Backtests one chunk of bars with known t_plus, returns the chunk with the result columns -- #
+    def process_chunk(self, chunk, warm, is_last):
+        n = len(chunk)
+        frame = pd.concat([warm, chunk]) if warm is not None else chunk
+        entry = np.asarray(self.signal_fn(frame))[len(frame) - n:]
+        close = chunk.close.values.astype(np.float64)
+        t_plus = chunk.t_plus.values.astype(np.float64)
+        # Special case of vertical barrier on the last bar of the history
+        at_end = np.zeros(n, dtype=bool)
+        at_end[-1] = is_last
+
+        cols = {'returns': np.zeros(n), 'holding': np.zeros(n, dtype=np.int64), 'direction': np.zeros(n, dtype=np.int64)}
+        start = self.resolve_open_position(close, at_end, cols) if self.open_pos else 0
+        trades = triple_barrier(entry[start:], t_plus[start:], close[start:], at_end[start:], self.ub_mult, self.lb_mult, self.max_holding_limit)
+        for col, values in trade_columns(trades, n - start).items():
+            cols[col][start:] = values
+        closed = trades['exit_idx'] >= 0
+        self.n_trades += int(closed.sum())
+        if len(closed) and not closed[-1]:
+            # The last trade is still open at the end of the chunk, carry it to the next one
+            self.open_pos = True
+            self.entry_price = trades['entry_price'][-1]
+            self.direction = int(trades['direction'][-1])
+            self.elapsed = n - start - 1 - int(trades['entry_idx'][-1])
+
+        out = chunk.copy()
+        out['entry'] = entry
+        for col, values in cols.items():
+            out[col] = values
+        self.n_bars += n
+        self.sum_returns += cols['returns'].sum()
+        return out
+
+    # -- Runs the backtest over an iterator of chunks and appends the results to out_path -- #
+    def run(self, chunks, out_path):
+        pending = None
+        warm = None
+        header = True
+        for chunk in chunks:
+            if pending is not None and len(chunk) < 2:
+                # The last bar of the history has to stay in the last chunk together with the bar before it
+                pending = pd.concat([pending, chunk])
+                continue
+            if pending is not None:
+                # t_plus of the last bar is the open of the first bar of the next chunk
+                pending['t_plus'] = pending.open.shift(-1)
+                pending.iloc[-1, pending.columns.get_loc('t_plus')] = chunk.open.iloc[0]
+                pending = pending.dropna()
+                out = self.process_chunk(pending, warm, False)
+                out.to_csv(out_path, mode='w' if header else 'a', header=header)
+                header = False
+                warm = pending.iloc[-self.warmup:] if self.warmup else None
+            pending = chunk.copy()
+        if pending is not None:
+            # Last chunk of the history, its last bar has no t_plus and is dropped like in DataManager
+            pending['t_plus'] = pending.open.shift(-1)
+            pending = pending.dropna()
+            if len(pending):
+                out = self.process_chunk(pending, warm, True)
+                out.to_csv(out_path, mode='w' if header else 'a', header=header)
+
+if __name__ == '__main__':
+    csv_path = '../Data/BPF_testset_1min.csv'
+    date_col = 'timestamp'
+
+    system = StreamingBacktest(strategy_signals(HigherLower, {'max_holding': 55}), 55, warmup=3)
+    system.run(csv_chunks(csv_path, date_col, chunksize=100_000), '../Backtests_Data/HigherLower_stream_1min.csv')
+    print(f"{system.n_bars} bars, {system.n_trades} trades, sum of returns {system.sum_returns}")
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# ---- NumPy implementation of the triple-barrier method used by the backtest loop ---- #
+# A position opened on bar i at price t_plus[i] is monitored from bar i+1 on and closed on the first bar where:
+# - the close touches the upper barrier (entry price * ub_mult) or the lower barrier (entry price * lb_mult)
+# - the timestamp is the end date of the backtest (special case of vertical barrier)
+# - max_holding bars have already passed without touching any barrier (vertical barrier)
+# The result is identical to the one produced by Backtest_LSTM/Backtest_Traditional.run_backtest
+
+# -- Finds for every candidate entry the offset (in bars) of the first barrier touch, -1 if the data ends before -- #
+def first_barrier_touch(entry_idx, t_plus, close, at_end, ub_mult, lb_mult, max_holding, chunk_size=4_000_000):
+    n = len(close)
+    width = max(max_holding, 0) + 1
+    # Pad the arrays so that the window of the last bars does not run out of bounds
+    close_pad = np.concatenate([close, np.full(width, np.nan)])
+    end_pad = np.concatenate([at_end, np.zeros(width, dtype=bool)])
+    offsets = np.arange(1, width + 1)
+    exit_offset = np.empty(len(entry_idx), dtype=np.int64)
+    # Process the entries in chunks so that the (entries x width) matrix stays bounded in memory
+    step = max(chunk_size // width, 1)
+    for start in range(0, len(entry_idx), step):
+        idx = entry_idx[start:start + step]
+        window = idx[:, None] + offsets
+        prices = close_pad[window]
+        upper = (t_plus[idx] * ub_mult)[:, None]
+        lower = (t_plus[idx] * lb_mult)[:, None]
+        hit = (prices >= upper) | (prices <= lower) | end_pad[window]
+        # Vertical barrier, always touched after max_holding bars
+        hit[:, -1] = True
+        k = hit.argmax(axis=1) + 1
+        # A touch after the last bar means the position is still open when the data ends
+        k[idx + k >= n] = -1
+        exit_offset[start:start + step] = k
+    return exit_offset
+
+# -- Runs the triple-barrier backtest on arrays and returns the entry/exit bars and results of every trade -- #
+def triple_barrier(entry, t_plus, close, at_end, ub_mult, lb_mult, max_holding):
+    entry = np.asarray(entry)
+    t_plus = np.asarray(t_plus, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    at_end = np.asarray(at_end, dtype=bool)
+
+    candidates = np.flatnonzero((entry == 1) | (entry == -1))
+    exit_offset = first_barrier_touch(candidates, t_plus, close, at_end, ub_mult, lb_mult, max_holding)
+
+    # Chain the trades: a new position can only be opened on a bar following the exit of the previous one
+    # next_candidate[i] is the position in candidates of the first entry signal on bar i or later
+    next_candidate = np.searchsorted(candidates, np.arange(len(close) + 1)).tolist()
+    candidate_list = candidates.tolist()
+    offset_list = exit_offset.tolist()
+    entries, exits = [], []
+    j = next_candidate[0]
+    while j < len(candidate_list):
+        entries.append(candidate_list[j])
+        if offset_list[j] < 0:
+            exits.append(-1)
+            break
+        exits.append(candidate_list[j] + offset_list[j])
+        j = next_candidate[exits[-1] + 1]
+
+    entries = np.array(entries, dtype=np.int64)
+    exits = np.array(exits, dtype=np.int64)
+    direction = entry[entries].astype(np.int64)
+    entry_price = t_plus[entries]
+    closed = exits >= 0
+    exit_price = np.where(closed, close[exits], np.nan)
+    trades = {
+        'entry_idx': entries,
+        'exit_idx': exits,
+        'direction': direction,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'holding': np.where(closed, exits - entries - 1, 0),
+        'pnl': (exit_price / entry_price - 1) * direction,
+    }
+    return trades
+
+# -- Expands the trades into the dense per-bar returns/holding/direction columns of the backtest -- #
+def trade_columns(trades, n):
+    closed = trades['exit_idx'] >= 0
+    exits = trades['exit_idx'][closed]
+    returns = np.zeros(n)
+    holding = np.zeros(n, dtype=np.int64)
+    direction = np.zeros(n, dtype=np.int64)
+    returns[exits] = trades['pnl'][closed]
+    holding[exits] = trades['holding'][closed]
+    direction[exits] = trades['direction'][closed]
+    return {'returns': returns, 'holding': holding, 'direction': direction}
+
+# ---- Sparse result of a backtest: one row per closed trade instead of one per bar ---- #
+class TradeLedger:
+    def __init__(self, trades, index):
+        closed = trades['exit_idx'] >= 0
+        self.entry_idx = trades['entry_idx'][closed].astype(np.int64)
+        self.exit_idx = trades['exit_idx'][closed].astype(np.int64)
+        self.direction = trades['direction'][closed].astype(np.int8)
+        self.holding = trades['holding'][closed].astype(np.int32)
+        self.entry_price = trades['entry_price'][closed].astype(np.float64)
+        self.exit_price = trades['exit_price'][closed].astype(np.float64)
+        self.pnl = trades['pnl'][closed].astype(np.float64)
+        # Timestamps of the bars, only used to build the dense view and the trade table
+        self.index = index
+        self.n_bars = len(index)
+
+    def __len__(self):
+        return len(self.pnl)
+
+    # -- One row per trade with its entry and exit timestamps -- #
+    def to_frame(self):
+        return pd.DataFrame({
+            'entry_time': self.index[self.entry_idx],
+            'exit_time': self.index[self.exit_idx],
+            'direction': self.direction,
+            'entry_price': self.entry_price,
+            'exit_price': self.exit_price,
+            'holding': self.holding,
+            'pnl': self.pnl,
+        })
+
+    # -- Dense per-bar returns/holding/direction columns, built only when they are needed (e.g. plots or saving the backtest) -- #
+    def to_dense(self):
+        returns = np.zeros(self.n_bars)
+        holding = np.zeros(self.n_bars, dtype=np.int64)
+        direction = np.zeros(self.n_bars, dtype=np.int64)
+        returns[self.exit_idx] = self.pnl
+        holding[self.exit_idx] = self.holding
+        direction[self.exit_idx] = self.direction
+        return {'returns': returns, 'holding': holding, 'direction': direction}
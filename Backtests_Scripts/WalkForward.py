@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import ParameterSweep
+from ParameterSweep import expand_grid, share_data, attach_shared_data, build_strategy
+from Datamanager import DataManager_Traditional
+from BacktestStatistics import BacktestProfile, LedgerProfile, profile_metrics
+from TripleBarrier import triple_barrier, TradeLedger
+from Backtest_Traditional import MomentumRSI
+
+# ---- Walk-forward optimisation ---- #
+# The timeline is split in rolling windows: the parameters are optimised on a train window and evaluated on the following test window.
+# The signals only depend on the signal parameters, so they are computed once over the whole history for each set of them
+# and every window slices the precomputed signals instead of recomputing indicators (or LSTM predictions).
+# Barrier parameters are applied by the triple barrier engine on the slice of each window.
+
+BARRIER_PARAMS = ('ub_mult', 'lb_mult', 'max_holding')
+
+# -- Splits a DatetimeIndex in rolling (train_start, test_start, test_end) positions, the windows move forward by the test length -- #
+def rolling_windows(index, train, test):
+    train, test = pd.Timedelta(train), pd.Timedelta(test)
+    windows = []
+    start = index[0]
+    while start + train < index[-1]:
+        i0, i1, i2 = index.searchsorted([start, start + train, start + train + test])
+        if i1 < i2:
+            windows.append((i0, i1, i2))
+        start = start + test
+    return windows
+
+# -- Metrics of a slice without any bar: no trade, flat equity and undefined ratios -- #
+def empty_metrics():
+    return {
+        'n_trades': 0,
+        'n_longs': 0,
+        'n_shorts': 0,
+        'total_return': 0.0,
+        'sharpe': np.nan,
+        'cagr': np.nan,
+        'calmar': np.nan,
+        'max_dd': 0.0,
+        'long_accuracy': np.nan,
+        'short_accuracy': np.nan,
+    }
+
+# -- Backtests one set of barrier parameters on a slice of the shared data and returns the metrics and the results -- #
+# With dense=False the metrics are computed from the trade ledger and no per-bar results are built (train slices)
+def evaluate_slice(data, signal_col, barriers, timeframe, start, stop, dense=True):
+    part = data.iloc[start:stop]
+    # The backtest of the window ends on its last bar, an open position is closed there
+    at_end = np.zeros(len(part), dtype=bool)
+    at_end[-1:] = True
+    trades = triple_barrier(part[signal_col].values, part.t_plus.values, part.close.values, at_end,
+                            barriers['ub_mult'], barriers['lb_mult'], barriers['max_holding'])
+    ledger = TradeLedger(trades, part.index)
+    bt = None
+    if dense:
+        bt = pd.DataFrame(ledger.to_dense())
+        bt.insert(0, 'timestamp', part.index)
+    if part.empty:
+        return empty_metrics(), bt
+    profile = BacktestProfile(bt, timeframe) if dense else LedgerProfile(ledger, timeframe)
+    return profile_metrics(profile), bt
+
+# -- Optimises the parameters on the train slice of a window and evaluates the best ones on its test slice -- #
+def run_window(window, candidates, timeframe, metric):
+    data = ParameterSweep._shared['data']
+    i0, i1, i2 = window
+    best, best_score = None, -np.inf
+    for signal_col, barriers, params in candidates:
+        score = evaluate_slice(data, signal_col, barriers, timeframe, i0, i1, dense=False)[0][metric]
+        if score > best_score:
+            best, best_score = (signal_col, barriers, params), score
+    result = {
+        'train_start': data.index[i0],
+        'test_start': data.index[i1],
+        'test_end': data.index[i2 - 1],
+        f'train_{metric}': best_score,
+    }
+    if best is None:
+        return result, None
+    signal_col, barriers, params = best
+    test_metrics, bt = evaluate_slice(data, signal_col, barriers, timeframe, i1, i2)
+    result.update(params)
+    result.update({f'test_{k}': v for k, v in test_metrics.items()})
+    return result, bt
+
+# -- Runs the walk-forward on a frame with close, t_plus and one entry column per signal parameter set -- #
+def walk_forward(frame, candidates, train, test, timeframe, metric='sharpe', n_workers=None):
+    windows = rolling_windows(frame.index, train, test)
+    n_workers = n_workers or os.cpu_count()
+    blocks, spec = share_data(frame)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_shared_data, initargs=(spec,)) as pool:
+            n = len(windows)
+            out = list(pool.map(run_window, windows, [candidates] * n, [timeframe] * n, [metric] * n))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    results = pd.DataFrame([r for r, _ in out])
+    # Out of sample backtest made of the test windows one after the other
+    tests = [bt for _, bt in out if bt is not None]
+    oos = pd.concat(tests, ignore_index=True) if tests else None
+    return results, oos
+
+# -- Combines the signal columns with every barrier parameter set of the grid -- #
+def make_candidates(signal_sets, param_grid):
+    barrier_grid = expand_grid({k: v for k, v in param_grid.items() if k in BARRIER_PARAMS})
+    candidates = []
+    for signal_col, signal_params in signal_sets:
+        for barriers in barrier_grid:
+            candidates.append((signal_col, barriers, dict(signal_params, **barriers)))
+    return candidates
+
+# -- Walk-forward for a Backtest_Traditional subclass, param_grid must contain ub_mult, lb_mult and max_holding -- #
+def walk_forward_traditional(strategy, csv_path, date_col, param_grid, train, test, timeframe='1min', metric='sharpe', n_workers=None):
+    missing = [k for k in BARRIER_PARAMS if k not in param_grid]
+    if missing:
+        raise ValueError(f'param_grid is missing the barrier parameters {missing}')
+    data = DataManager_Traditional(csv_path, date_col).data
+    dmgt = DataManager_Traditional.from_data(data)
+    if timeframe != '1min':
+        dmgt.change_resolution(timeframe)
+    base = dmgt.df.dropna()
+    frame = pd.DataFrame({'close': base.close, 't_plus': base.t_plus})
+
+    # Indicators and signals are computed once over the whole history for every set of signal parameters
+    signal_grid = expand_grid({k: v for k, v in param_grid.items() if k not in BARRIER_PARAMS})
+    barrier_defaults = {k: v[0] for k, v in param_grid.items() if k in BARRIER_PARAMS}
+    signal_sets = [(f'entry_{i}', signal_params) for i, signal_params in enumerate(signal_grid)]
+    signal_params = getattr(strategy, 'signal_params', None)
+    if signal_params is not None and set(signal_grid[0]) == set(signal_params):
+        # Pure signal function of the strategy: all the parameter sets in one call, the indicators are shared between them
+        params = [[p[k] for p in signal_grid] for k in signal_params]
+        entry, _ = strategy.signals(base.open.values, base.high.values, base.low.values, base.close.values, base.get('volume'), *params)
+        # One row per parameter set (a single 1-D row for the strategies without signal parameters)
+        entry = entry.reshape(len(signal_sets), -1)
+        for i, (col, _) in enumerate(signal_sets):
+            frame[col] = entry[i]
+    else:
+        for col, signal_params in signal_sets:
+            system = build_strategy(strategy, DataManager_Traditional.from_data(base, timeframe), dict(signal_params, **barrier_defaults))
+            system.generate_signals()
+            frame[col] = system.dmgt.df.entry.reindex(frame.index).fillna(0).values
+
+    candidates = make_candidates(signal_sets, param_grid)
+    return walk_forward(frame, candidates, train, test, timeframe, metric, n_workers)
+
+# -- Walk-forward for the LSTM strategy: the predictions are made once and only entry_cond and the barriers are optimised -- #
+def walk_forward_lstm(system, param_grid, train, test, metric='sharpe', n_workers=None):
+    data, pred, res = system.predict()
+    res = np.asarray(res).reshape(-1)
+    frame = pd.DataFrame({'close': data.close.values, 't_plus': data.t_plus.values}, index=pd.DatetimeIndex(data.timestamp))
+
+    signal_sets = []
+    for i, entry_cond in enumerate(param_grid['entry_cond']):
+        frame[f'entry_{i}'] = 1 * (res > entry_cond) - 1 * (res < -entry_cond)
+        signal_sets.append((f'entry_{i}', {'entry_cond': entry_cond}))
+
+    candidates = make_candidates(signal_sets, param_grid)
+    return walk_forward(frame, candidates, train, test, system.dmgt.timeframe, metric, n_workers)
+
+if __name__ == '__main__':
+    csv_path = '../Data/BPF_testset_1min.csv'
+    date_col = 'timestamp'
+
+    param_grid = {
+        'max_holding': [25, 55],
+        'ub_mult': [1.01, 1.03],
+        'lb_mult': [0.99, 0.97],
+        'rsi_window': [9, 14],
+        'rsi_long': [25, 30],
+        'rsi_short': [70, 75],
+        'ma_long': [26],
+        'ma_short': [12],
+    }
+    # Optimise on 4 weeks, trade the following week
+    results, oos = walk_forward_traditional(MomentumRSI, csv_path, date_col, param_grid, train='28D', test='7D', timeframe='20min')
+    print(results)
+    BacktestProfile(oos, '20min').show_ratios()
+
+    # LSTM: predictions are computed once, entry_cond and barriers are optimised on each window
+    # from Backtest_LSTM import LSTM
+    # lstm_grid = {'entry_cond': [0.01, 0.02, 0.03], 'max_holding': [25, 55], 'ub_mult': [1.03], 'lb_mult': [0.97]}
+    # results, oos = walk_forward_lstm(LSTM(csv_path, 55), lstm_grid, train='14D', test='3D')
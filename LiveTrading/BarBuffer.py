@@ -0,0 +1,57 @@
+import numpy as np
+
+# ---- Fixed-capacity ring buffer of the last bars of the live strategy ---- #
+# Every column is a numpy array of twice the capacity and each bar is written at two positions, i and i + capacity, so the
+# last n bars (n <= capacity) are always contiguous: they are returned as views of the arrays, without copy and without
+# building a DataFrame. Appending a bar writes two values per column whatever the number of bars kept. The bars are kept
+# in the order of their ticks, a bar that is not newer than the last one (e.g. sent twice) is not appended.
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+class BarBuffer:
+    def __init__(self, capacity, fields=FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.ticks = np.zeros(2 * capacity, dtype=np.int64)
+        self.values = np.full((len(self.fields), 2 * capacity), np.nan)
+        self.n = 0 # Bars appended since the creation of the buffer
+
+    def __len__(self):
+        return min(self.n, self.capacity)
+
+    # -- Tick (ms) of the last bar, None if the buffer is empty -- #
+    @property
+    def last_tick(self):
+        return int(self.ticks[self.end - 1]) if self.n else None
+
+    # -- Position after the last bar in the second half of the arrays -- #
+    @property
+    def end(self):
+        return (self.n - 1) % self.capacity + self.capacity + 1 if self.n else self.capacity
+
+    # -- Appends a bar (values in the order of the fields), False if it is not newer than the last one -- #
+    def append(self, tick, *values):
+        if self.n and tick <= self.ticks[self.end - 1]:
+            return False
+        i = self.n % self.capacity
+        self.ticks[i] = self.ticks[i + self.capacity] = tick
+        self.values[:, i] = self.values[:, i + self.capacity] = values
+        self.n += 1
+        return True
+
+    # -- Views of the ticks and of the (n_fields, n) values of the last n bars (all the kept ones by default) -- #
+    def window(self, n=None):
+        n = len(self) if n is None else min(n, len(self))
+        end = self.end
+        return self.ticks[end - n:end], self.values[:, end - n:end]
+
+    # -- View of a column over the last n bars, e.g. bars['close'][-1] -- #
+    def column(self, name, n=None):
+        return self.window(n)[1][self.fields.index(name)]
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    # -- Timestamps of the last n bars, a datetime64 view of the ticks -- #
+    def timestamps(self, n=None):
+        return self.window(n)[0].view('datetime64[ms]')
@@ -1,7 +1,197 @@
 import asyncio
+import itertools
+import threading
 import websockets
+from websockets.exceptions import ConnectionClosed
 import json
 from termcolor import colored
+from Metrics import metrics
+
+# ---- Persistent JSON-RPC session with Deribit ---- #
+# One WebSocket connection is opened and authenticated once, then every request is sent on it with a unique id and matched
+# with its response by the reader task, so concurrent requests share the connection. The access token is refreshed before
+# it expires. When the connection is lost it is reopened (and authenticated again) by the next request, or right away
+# when there are subscriptions: their channels are subscribed again and the reconnection listeners are called.
+
+REQUEST_TIMEOUT = 10 # Seconds before a request without response fails
+REFRESH_MARGIN = 60 # Seconds before the expiry of the access token at which it is refreshed
+RECONNECT_ATTEMPTS = 5
+
+class RequestNotSent(ConnectionError):
+    pass
+
+# -- Done callback of the background tasks, their exception (e.g. an auth failure while reconnecting) is printed instead of lost -- #
+def report_exception(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(colored(f'{task.get_name()} failed: {task.exception()!r}', 'red'))
+
+def background_task(coro, name):
+    task = asyncio.create_task(coro, name=name)
+    task.add_done_callback(report_exception)
+    return task
+
+# -- Requests that can be sent again if the connection was lost before their response, they do not change the account -- #
+def idempotent(method):
+    return method.startswith('public/') or method.startswith('private/get_')
+
+class DeribitSession:
+    def __init__(self, url, client_id=None, client_secret=None, timeout=REQUEST_TIMEOUT):
+        self.url = url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.ws = None
+        self.ids = itertools.count(1)
+        self.pending = {} # Futures of the requests waiting for their response, by id
+        self.connect_lock = asyncio.Lock()
+        self.reader = None
+        self.refresher = None
+        self.restorer = None # Task reconnecting and subscribing again after the connection was lost
+        self.auth = None # Result of the last public/auth (access_token, refresh_token, expires_in, ...)
+        self.channels = {} # Handlers of the notifications of the subscribed channels
+        self.reconnect_listeners = [] # Called once the subscriptions are restored after a reconnection (e.g. to backfill)
+        self.closing = False
+
+    # -- Opens (and authenticates) the connection if it is not open -- #
+    async def connect(self):
+        async with self.connect_lock:
+            if self.ws is not None:
+                return
+            delay = 0.5
+            for attempt in range(RECONNECT_ATTEMPTS):
+                try:
+                    ws = await websockets.connect(self.url)
+                    break
+                except OSError as e:
+                    if attempt == RECONNECT_ATTEMPTS - 1:
+                        raise ConnectionError(f'Could not connect to {self.url}: {e}')
+                    await asyncio.sleep(delay)
+                    delay *= 2
+            self.ws = ws
+            self.reader = background_task(self.read(ws), 'Deribit reader')
+            if self.client_id is not None:
+                try:
+                    await self.authenticate()
+                except BaseException:
+                    # A connection that is not authenticated is not kept
+                    self.disconnected(ws)
+                    await ws.close()
+                    raise
+
+    # -- Authenticates the connection, with the refresh token if there is one and it is still accepted -- #
+    async def authenticate(self, refresh=False):
+        if refresh:
+            params = {'grant_type': 'refresh_token', 'refresh_token': self.auth['refresh_token']}
+        else:
+            params = {'grant_type': 'client_credentials', 'client_id': self.client_id, 'client_secret': self.client_secret}
+        response = await self.send('public/auth', params)
+        if 'error' in response:
+            if refresh:
+                return await self.authenticate()
+            raise Exception(f"Auth failed with error {response['error']}")
+        self.auth = response['result']
+        if self.refresher is not None and self.refresher is not asyncio.current_task():
+            self.refresher.cancel()
+        expires_in = self.auth['expires_in']
+        self.refresher = background_task(self.refresh_later(max(expires_in - REFRESH_MARGIN, expires_in / 2)), 'Deribit token refresh')
+
+    async def refresh_later(self, delay):
+        await asyncio.sleep(delay)
+        try:
+            await self.authenticate(refresh=True)
+        except (ConnectionError, asyncio.TimeoutError):
+            # The connection is authenticated again when it is reopened
+            pass
+
+    # -- Sends a request on the open connection and waits for its response -- #
+    async def send(self, method, params):
+        ws = self.ws
+        if ws is None:
+            raise RequestNotSent('Not connected')
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            try:
+                await ws.send(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}))
+            except ConnectionClosed as e:
+                # This request did not reach the exchange, only the other ones fail with the connection
+                future.cancel()
+                self.disconnected(ws)
+                raise RequestNotSent(f'Connection closed: {e}')
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    # -- Sends a request (reconnecting first if needed) and returns the JSON response, with its result or its error -- #
+    async def request(self, method, params=None):
+        for attempt in range(2):
+            await self.connect()
+            try:
+                return await self.send(method, params or {})
+            except ConnectionError as e:
+                # A request that may have reached the exchange (e.g. an order) is not sent twice
+                if attempt or not (isinstance(e, RequestNotSent) or idempotent(method)):
+                    raise
+
+    # -- Subscribes to channels, handler(data) is called (in the loop of the session) with the data of their notifications -- #
+    async def subscribe(self, channels, handler):
+        for channel in channels:
+            self.channels[channel] = handler
+        return await self.request('public/subscribe', {'channels': list(channels)})
+
+    # -- Reader task of a connection: resolves the futures of the responses by id and dispatches the notifications -- #
+    async def read(self, ws):
+        try:
+            async for message in ws:
+                with metrics.span('json_decode'):
+                    data = json.loads(message)
+                if data.get('method') == 'subscription':
+                    handler = self.channels.get(data['params']['channel'])
+                    if handler is not None:
+                        handler(data['params']['data'])
+                    continue
+                future = self.pending.get(data.get('id'))
+                if future is not None and not future.done():
+                    future.set_result(data)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.disconnected(ws)
+            if self.channels and not self.closing:
+                self.restorer = background_task(self.restore(), 'Deribit reconnection')
+
+    # -- Reconnects until it succeeds and subscribes to the channels again -- #
+    async def restore(self):
+        while not self.closing:
+            try:
+                await self.connect()
+                await self.send('public/subscribe', {'channels': list(self.channels)})
+                break
+            except (ConnectionError, asyncio.TimeoutError):
+                await asyncio.sleep(1)
+        if not self.closing:
+            for listener in self.reconnect_listeners:
+                listener()
+
+    # -- Forgets a lost connection, the requests waiting on it fail -- #
+    def disconnected(self, ws):
+        if self.ws is not ws:
+            return
+        self.ws = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('Connection lost'))
+
+    async def close(self):
+        self.closing = True
+        for task in (self.refresher, self.restorer):
+            if task is not None:
+                task.cancel()
+        ws = self.ws
+        if ws is not None:
+            self.disconnected(ws)
+            await ws.close()
 
 class DeribitWS:
     def __init__(self, client_id, client_secret, live): 
@@ -14,50 +204,37 @@ class DeribitWS:
 
         self.client_id = client_id
         self.client_secret = client_secret
-        self.auth_creds = {
-              "jsonrpc" : "2.0",
-              "id" : 0,
-              "method" : "public/auth",
-              "params" : {
-                "grant_type" : "client_credentials",
-                "client_id" : self.client_id,
-                "client_secret" : self.client_secret
-              }
-            }
+        # The session lives in an event loop running in a background thread, the methods below are synchronous wrappers
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.session = self.run(self.make_session())
         self.test_creds()
-        self.msg = {
-            "jsonrpc": "2.0",
-            "id": 0,
-            "method": None,
-        }
 
-    async def pub_api(self, msg):
-        async with websockets.connect(self.url) as websocket:
-            await websocket.send(msg)
-            while websocket.open:
-                response = await websocket.recv()
-                return json.loads(response)
-
-    async def priv_api(self, msg):
-        async with websockets.connect(self.url) as websocket:
-            await websocket.send(json.dumps(self.auth_creds))
-            while websocket.open:
-                response = await websocket.recv()
-                await websocket.send(msg)
-                response = await websocket.recv()
-                break
-            return json.loads(response)
+    async def make_session(self):
+        return DeribitSession(self.url, self.client_id, self.client_secret)
+
+    # -- Runs a coroutine in the loop of the session and waits for its result -- #
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # -- Same from an other event loop (e.g. the bar scheduler) without blocking it -- #
+    def run_async(self, coro):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def request_async(self, method, params=None):
+        return self.run_async(self.session.request(method, params))
 
-    @staticmethod
-    def async_loop(api, message):
-        return asyncio.get_event_loop().run_until_complete(api(message))
+    def request(self, method, params=None):
+        return self.run(self.session.request(method, params))
 
     def test_creds(self):
-        response = self.async_loop(self.pub_api, json.dumps(self.auth_creds))
-        if 'error' in response.keys():
-            raise Exception(f"Auth failed with error {response['error']}")
-        else:
-            print(colored("Auth creds are good, it worked",'green'))
+        # Opens the connection and authenticates it, raises if the credentials are refused
+        self.run(self.session.connect())
+        print(colored("Auth creds are good, it worked",'green'))
+
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
     def market_order(self, instrument, amount, direction):
         params = {
@@ -72,9 +249,9 @@ class DeribitWS:
         else:
             raise ValueError('direction must be long or short')
         
-        self.msg["method"] = f"private/{side}"
-        self.msg["params"] = params
-        response = self.async_loop(self.priv_api, json.dumps(self.msg))
+        # Round-trip of the order, from the request to the response of the exchange
+        with metrics.span('order'):
+            response = self.request(f"private/{side}", params)
         return response
 
     # ---- Market data methods ---- #
@@ -86,9 +263,7 @@ class DeribitWS:
                 "end_timestamp": end,
                 "resolution": timeframe
             }
-        self.msg["method"] = "public/get_tradingview_chart_data"
-        self.msg["params"] = params
-        data = self.async_loop(self.pub_api, json.dumps(self.msg))
+        data = self.request("public/get_tradingview_chart_data", params)
         return data
 
     def get_orderbook(self, instrument, depth=5):
@@ -96,18 +271,14 @@ class DeribitWS:
             "instrument_name": instrument,
             "depth": depth
         }
-        self.msg["method"] = "public/get_order_book"
-        self.msg["params"] = params
-        order_book = self.async_loop(self.pub_api, json.dumps(self.msg))
+        order_book = self.request("public/get_order_book", params)
         return order_book
 
     def get_quote(self, instrument):
         params = {
             "instrument_name": instrument
         }
-        self.msg["method"] = "public/ticker"
-        self.msg["params"] = params
-        quote = self.async_loop(self.pub_api, json.dumps(self.msg))
+        quote = self.request("public/ticker", params)
         return quote['result']['last_price']
 
     # ---- Account methods ---- #
@@ -117,9 +288,7 @@ class DeribitWS:
             "currency": currency,
             "extended": extended,
         }
-        self.msg["method"] = "private/get_account_summary"
-        self.msg["params"] = params
-        summary = self.async_loop(self.priv_api, json.dumps(self.msg))
+        summary = self.request("private/get_account_summary", params)
         return summary
 
     def get_positions(self, instrument, kind="future"):
@@ -127,9 +296,7 @@ class DeribitWS:
             "instrument_name": instrument,
             "kind": kind
         }
-        self.msg["method"] = "private/get_positions"
-        self.msg["params"] = params
-        positions = self.async_loop(self.priv_api, json.dumps(self.msg))
+        positions = self.request("private/get_positions", params)
         return positions
 
     def available_instruments(self, currency, kind="future", expired=False):
@@ -138,9 +305,7 @@ class DeribitWS:
             "kind": kind,
             "expired": expired
         }
-        self.msg["method"] = "public/get_instruments"
-        self.msg["params"] = params
-        resp = self.async_loop(self.pub_api, json.dumps(self.msg))
+        resp = self.request("public/get_instruments", params)
         instruments = [d["instrument_name"] for d in resp['result']]
         return instruments
 
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import datetime as dt
+from termcolor import colored
+from Metrics import metrics
+from DeribitWS import background_task
+from Scheduler import tick_string
+
+# ---- Bars pushed by the Deribit subscriptions ---- #
+# The chart.trades channel sends the state of the bar in progress at every trade, the bar is closed as soon as the first
+# update of the next bar arrives (or, when there is no trade, once its period has elapsed). The closed bars are delivered in
+# order and only once. A missing bar (e.g. while the connection was lost) is detected when the next one is delivered, or
+# right after the reconnection, and only the missing bars are requested with public/get_tradingview_chart_data. Bars that
+# cannot be requested are reported to on_gap, so the consumer knows that the next bar does not follow the last one.
+
+CLOSE_GRACE = 2 # Seconds after the end of a bar without trades before it is closed
+BACKFILL_ATTEMPTS = 3
+
+# -- Duration of a Deribit chart resolution in milliseconds ('1', '3', ..., '720' minutes or '1D') -- #
+def resolution_ms(resolution):
+    return 86_400_000 if resolution == '1D' else int(resolution) * 60_000
+
+# -- Bar in the format of Processor.json_to_dataframe -- #
+def make_bar(tick, open, high, low, close, volume, cost, backfill):
+    return {
+        'ticks': tick,
+        'open': open,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'cost': cost,
+        'timestamp': dt.datetime.utcfromtimestamp(tick / 1000),
+        'backfill': backfill, # True for the bars requested after a gap
+    }
+
+class BarStream:
+    def __init__(self, session, instrument, resolution, on_bar, on_gap=None):
+        self.session = session
+        self.instrument = instrument
+        self.resolution = resolution
+        self.period = resolution_ms(resolution)
+        # Called in the loop of the session with every closed bar, must not block (e.g. queue.Queue.put)
+        self.on_bar = on_bar
+        # Called the same way with the ticks (start, end) of the bars lost when a backfill fails, before the next bar
+        self.on_gap = on_gap
+        self.current = None # Last state of the bar in progress
+        self.close_timer = None
+        self.last_closed = None # Tick of the last delivered bar
+        self.closed = None # Queue of the bars to deliver, None marks a catch-up after a (re)connection
+        self.deliverer = None # Task delivering the closed bars
+
+    # -- Subscribes to the channels, the bars closed from start (tick in ms) onwards are delivered first -- #
+    async def start(self, start=None):
+        self.closed = asyncio.Queue()
+        if start is not None:
+            self.last_closed = start - start % self.period - self.period
+            self.closed.put_nowait(None)
+        self.deliverer = background_task(self.deliver(), f'Bars of {self.instrument}')
+        self.session.reconnect_listeners.append(self.reconnected)
+        await self.session.subscribe([f'chart.trades.{self.instrument}.{self.resolution}'], self.on_chart)
+
+    # -- Update of the bar in progress, the previous bar is closed when the first update of a new one arrives -- #
+    def on_chart(self, data):
+        if self.current is not None and data['tick'] < self.current['tick']:
+            return
+        if self.current is not None and data['tick'] > self.current['tick']:
+            self.close_current()
+        if self.current is None or data['tick'] != self.current['tick']:
+            # Without trades in the next bar the bar is closed by time
+            self.close_timer = asyncio.get_running_loop().call_later(
+                max((data['tick'] + self.period) / 1000 + CLOSE_GRACE - time.time(), 0), self.close_current)
+        self.current = data
+
+    def close_current(self):
+        if self.close_timer is not None:
+            self.close_timer.cancel()
+            self.close_timer = None
+        if self.current is not None:
+            c = self.current
+            self.closed.put_nowait(make_bar(c['tick'], c['open'], c['high'], c['low'], c['close'], c['volume'], c.get('cost'), False))
+            self.current = None
+
+    # -- The bar in progress when the connection was lost may have missed updates, it is requested with the missing ones -- #
+    def reconnected(self):
+        if self.close_timer is not None:
+            self.close_timer.cancel()
+            self.close_timer = None
+        self.current = None
+        self.closed.put_nowait(None)
+
+    # -- Delivers the closed bars in order, backfilling the gaps -- #
+    async def deliver(self):
+        while True:
+            bar = await self.closed.get()
+            if bar is None:
+                # Catch-up: every bar closed since the last delivered one
+                last = int(time.time() * 1000) // self.period * self.period - self.period
+                if self.last_closed is not None:
+                    await self.backfill(self.last_closed + self.period, last)
+                continue
+            if self.last_closed is not None and bar['ticks'] > self.last_closed + self.period:
+                await self.backfill(self.last_closed + self.period, bar['ticks'] - self.period)
+            self.emit(bar)
+
+    def emit(self, bar):
+        if self.last_closed is not None and bar['ticks'] <= self.last_closed:
+            return
+        self.last_closed = bar['ticks']
+        self.on_bar(bar)
+
+    # -- Requests the bars between the ticks start and end (included) and delivers them -- #
+    async def backfill(self, start, end):
+        if end < start:
+            return
+        params = {'instrument_name': self.instrument, 'start_timestamp': start, 'end_timestamp': end, 'resolution': self.resolution}
+        for attempt in range(BACKFILL_ATTEMPTS):
+            try:
+                with metrics.span('data_fetch'):
+                    res = (await self.session.request('public/get_tradingview_chart_data', params)).get('result')
+                if res and res.get('status') in ('ok', 'no_data'):
+                    break
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(1)
+        else:
+            print(colored(f'Bars from {tick_string(start)} to {tick_string(end)} could not be backfilled', 'red'))
+            # The gap is reported once, the bars after it are delivered
+            self.last_closed = end
+            if self.on_gap is not None:
+                self.on_gap(start, end)
+            return
+        if res['status'] == 'no_data':
+            return
+        for i, tick in enumerate(res['ticks']):
+            if start <= tick <= end:
+                self.emit(make_bar(tick, res['open'][i], res['high'][i], res['low'][i], res['close'][i], res['volume'][i],
+                                   res['cost'][i], True))
@@ -0,0 +1,192 @@
+import os
+import math
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ---- Latency of the stages of the live decision pipeline ---- #
+# Every stage (data fetch, JSON decode, features, scaling, inference, signal, order round-trip, ...) records its durations
+# in a histogram with logarithmic buckets (HdrHistogram layout): values below 2^SUB_BITS microseconds are exact, the larger
+# ones are kept with a relative error below 2^(1 - SUB_BITS), whatever their range. The p50/p99/max of the stages are
+# written periodically to a file in the Prometheus text format and can be served over HTTP for a Prometheus scraper.
+# Disabled (the default) a span is a shared object whose enter and exit do nothing, and record returns right away.
+
+SUB_BITS = 8 # 0.8% relative precision
+QUANTILES = {'p50': 0.5, 'p99': 0.99}
+METRIC = 'trading_stage_latency_seconds'
+METRIC_MAX = 'trading_stage_latency_max_seconds'
+
+class LatencyHistogram:
+    def __init__(self, sub_bits=SUB_BITS):
+        self.sub_bits = sub_bits
+        self.counts = [0] * (1 << sub_bits) # Grows with the largest value recorded
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    # -- Bucket of a value in microseconds -- #
+    def index(self, value):
+        shift = value.bit_length() - self.sub_bits
+        if shift <= 0:
+            return value
+        half = 1 << (self.sub_bits - 1)
+        return (1 << self.sub_bits) + (shift - 1) * half + (value >> shift) - half
+
+    # -- Largest value that falls in a bucket -- #
+    def highest(self, index):
+        if index < 1 << self.sub_bits:
+            return index
+        half = 1 << (self.sub_bits - 1)
+        shift, sub = divmod(index - (1 << self.sub_bits), half)
+        shift += 1
+        return ((sub + half) << shift) + (1 << shift) - 1
+
+    def record(self, value):
+        i = self.index(value)
+        if i >= len(self.counts):
+            self.counts.extend([0] * (i + 1 - len(self.counts)))
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # -- Value (microseconds) below which a fraction q of the recorded values are -- #
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.highest(i), self.max)
+        return self.max
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.path = None
+        self.stop = None
+        self.server = None
+
+    # -- Times the block in it under the name of a stage, e.g. with metrics.span('inference'): ... -- #
+    def span(self, stage):
+        return Span(self, stage) if self.enabled else NULL_SPAN
+
+    # -- Records a duration in seconds -- #
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        value = max(int(seconds * 1_000_000), 0)
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = LatencyHistogram()
+            self.histograms[stage].record(value)
+
+    # -- Count, mean, quantiles and max (in seconds) of every stage -- #
+    def summary(self):
+        with self.lock:
+            return {
+                stage: {
+                    'count': h.count,
+                    'sum': h.sum / 1e6,
+                    'mean': h.sum / h.count / 1e6,
+                    **{name: h.quantile(q) / 1e6 for name, q in QUANTILES.items()},
+                    'max': h.max / 1e6,
+                }
+                for stage, h in self.histograms.items()
+            }
+
+    # -- Summary in the Prometheus text exposition format -- #
+    def prometheus(self):
+        summary = self.summary()
+        lines = [f'# HELP {METRIC} Latency of the stages of the live decision pipeline', f'# TYPE {METRIC} summary']
+        for stage, s in summary.items():
+            for name, q in QUANTILES.items():
+                lines.append(f'{METRIC}{{stage="{stage}",quantile="{q:g}"}} {s[name]:.6f}')
+            lines.append(f'{METRIC}_sum{{stage="{stage}"}} {s["sum"]:.6f}')
+            lines.append(f'{METRIC}_count{{stage="{stage}"}} {s["count"]}')
+        lines += [f'# HELP {METRIC_MAX} Longest duration of the stages', f'# TYPE {METRIC_MAX} gauge']
+        for stage, s in summary.items():
+            lines.append(f'{METRIC_MAX}{{stage="{stage}"}} {s["max"]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    # -- Writes the Prometheus text to the file, replaced once it is complete -- #
+    def dump(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        tmp = f'{path}.tmp{os.getpid()}'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    # -- Lines p50/p99/max (in ms) of the stages for the console -- #
+    def report(self):
+        return [f"{stage:<12} n={s['count']:<6} p50={s['p50'] * 1e3:.3f}ms p99={s['p99'] * 1e3:.3f}ms max={s['max'] * 1e3:.3f}ms"
+                for stage, s in self.summary().items()]
+
+    # -- Starts recording, writes the file every interval seconds (if path) and serves /metrics on localhost (if port) -- #
+    def enable(self, path=None, interval=60, port=None):
+        self.enabled = True
+        self.path = path
+        if path is not None:
+            self.stop = threading.Event()
+            def write_periodically(stop):
+                while not stop.wait(interval):
+                    self.dump()
+            threading.Thread(target=write_periodically, args=(self.stop,), daemon=True).start()
+        if port is not None:
+            metrics = self
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # -- Stops recording, the file is written a last time -- #
+    def disable(self):
+        if self.stop is not None:
+            self.stop.set()
+            self.stop = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        self.dump()
+        self.enabled = False
+
+# Metrics shared by the modules of the process
+metrics = Metrics()
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from termcolor import colored
+
+# ---- Bar-close scheduler of the live strategy ---- #
+# The scheduler sleeps in its own event loop until the next closed bar is pushed (put is thread-safe, e.g. the on_bar of a
+# BarStream running in the loop of the session) or until the deadline of the expected bar, so it does not use the CPU
+# between the bars. Every bar is handed once, in order, to the decision pipeline, which runs in a worker thread (it sends
+# synchronous requests) while the loop keeps track of the time. A bar has until DEADLINE seconds after its close: a bar
+# that has not arrived by then is reported as missed, and a bar arriving later (backfilled) only updates the state. Bars
+# that will never arrive (put_gap, e.g. a failed backfill) are recorded as missed and handed to on_gap before the next bar.
+
+DEADLINE = 15 # Seconds after the close of a bar within which its decision must be taken
+
+def tick_string(tick):
+    return dt.datetime.utcfromtimestamp(tick / 1000).strftime('%d/%m/%Y %H:%M')
+
+class BarScheduler:
+    def __init__(self, period, on_bar, deadline=DEADLINE, on_gap=None):
+        self.period = period # Milliseconds
+        # on_bar(bar, decide) is called in a worker thread, decide is False for the bars past their deadline
+        self.on_bar = on_bar
+        # on_gap(start, end) is called in the same worker thread with the ticks of the lost bars, e.g. to reset the indicators
+        self.on_gap = on_gap
+        self.deadline = deadline * 1000
+        self.loop = None
+        self.bars = None
+        self.last_tick = None # Tick of the last bar handed to on_bar
+        self.expected = None # Tick of the next bar
+        self.missed = [] # Ticks of the bars that had not arrived by their deadline
+        self.overruns = [] # Ticks of the bars whose decision finished after their deadline
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    # -- Hands a closed bar to the scheduler, from any thread -- #
+    def put(self, bar):
+        try:
+            self.loop.call_soon_threadsafe(self.bars.put_nowait, bar)
+        except (AttributeError, RuntimeError):
+            # Not running (yet or anymore), the bar is dropped
+            pass
+
+    # -- Reports from any thread that the bars from start to end (ticks, included) will never arrive, in order with the bars -- #
+    def put_gap(self, start, end):
+        self.put({'gap': (start, end)})
+
+    def due(self, tick):
+        return tick + self.period + self.deadline
+
+    # -- Runs until endtime (local datetime), start() returns an awaitable subscribing the source of the bars -- #
+    def run(self, endtime, start=None):
+        asyncio.run(self.main(endtime.timestamp() * 1000, start))
+
+    async def main(self, end, start):
+        self.loop = asyncio.get_running_loop()
+        self.bars = asyncio.Queue()
+        if start is not None:
+            await start()
+        try:
+            while True:
+                now = time.time() * 1000
+                if now >= end:
+                    break
+                wake = end if self.expected is None else min(end, self.due(self.expected))
+                try:
+                    bar = self.bars.get_nowait() if not self.bars.empty() else \
+                        await asyncio.wait_for(self.bars.get(), max(wake - now, 0) / 1000)
+                except asyncio.TimeoutError:
+                    if self.expected is not None and time.time() * 1000 >= self.due(self.expected):
+                        self.report_missed(self.expected)
+                    continue
+                await self.handle(bar)
+        finally:
+            self.loop = None
+            self.executor.shutdown(wait=True)
+
+    async def handle(self, bar):
+        if 'gap' in bar:
+            return await self.handle_gap(*bar['gap'])
+        tick = bar['ticks']
+        if self.last_tick is not None and tick <= self.last_tick:
+            return
+        decide = time.time() * 1000 < self.due(tick)
+        if not decide and tick in self.missed:
+            print(colored(f'Bar {tick_string(tick)} arrived after its deadline, only the indicators are updated', 'yellow'))
+        self.last_tick = tick
+        self.expected = tick + self.period
+        future = self.loop.run_in_executor(self.executor, self.on_bar, bar, decide)
+        if decide:
+            done, _ = await asyncio.wait({future}, timeout=max(self.due(tick) - time.time() * 1000, 0) / 1000)
+            if not done:
+                self.overruns.append(tick)
+                print(colored(f'Decision of bar {tick_string(tick)} overran its deadline', 'red'))
+        # The next bar is only handed once this one is done
+        await future
+
+    async def handle_gap(self, start, end):
+        if self.last_tick is not None and end <= self.last_tick:
+            return
+        self.missed.extend(tick for tick in range(start, end + 1, self.period) if tick not in self.missed)
+        self.last_tick = end
+        self.expected = end + self.period
+        if self.on_gap is not None:
+            await self.loop.run_in_executor(self.executor, self.on_gap, start, end)
+
+    def report_missed(self, tick):
+        self.missed.append(tick)
+        print(colored(f'Bar {tick_string(tick)} missed: not received {self.deadline / 1000:g}s after its close', 'red'))
+        # If the missed bar is backfilled later it only updates the indicators
+        self.expected = tick + self.period
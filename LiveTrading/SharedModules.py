@@ -0,0 +1,11 @@
+import os
+import sys
+
+# ---- Makes the modules shared by the backtests and the live trading importable ---- #
+# TechnicalIndicator, ModelRegistry and NumpyLSTM are kept once in the Shared folder at the root of the repository. The
+# scripts of this folder import this module before importing them.
+
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Shared')
+if SHARED_DIR not in sys.path:
+    # After the folder of the script, before the installed packages
+    sys.path.insert(1, SHARED_DIR)
@@ -0,0 +1,173 @@
+from collections import deque
+import numpy as np
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import FEATURES
+
+# ---- Technical indicators updated one bar at a time for live trading ---- #
+# Same indicators as get_technical_indicators but the state (windows of the last opens, exponential averages,
+# running sums) is kept between the bars, so every new bar costs a constant number of operations instead of
+# recomputing the indicators over the whole lookback. The values are the ones get_technical_indicators gives
+# when it is run over all the bars fed since the creation of the object.
+
+# -- Exponential moving average, same recursion as pandas ewm(...).mean() -- #
+class StreamingEWM:
+    def __init__(self, alpha, adjust=True, min_periods=0):
+        self.old_wt_factor = 1 - alpha
+        self.new_wt = 1 if adjust else alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.weighted = np.nan
+        self.old_wt = 1.
+        self.nobs = 0
+
+    def update(self, value):
+        self.nobs += 1
+        if self.nobs == 1:
+            self.weighted = value
+        else:
+            self.old_wt *= self.old_wt_factor
+            if self.weighted != value:
+                self.weighted = (self.old_wt * self.weighted + self.new_wt * value) / (self.old_wt + self.new_wt)
+            self.old_wt = self.old_wt + self.new_wt if self.adjust else 1.
+        return self.value
+
+    @property
+    def value(self):
+        return self.weighted if self.nobs >= self.min_periods else np.nan
+
+# -- Rolling mean and sample standard deviation of the last `window` values, updated when a value enters and one leaves -- #
+class StreamingRolling:
+    def __init__(self, window):
+        self.window = window
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0. # Sum of the squared differences from the mean (Welford)
+
+    def update(self, value, leaving=None):
+        if leaving is None:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+        else:
+            # The window is full, the oldest value is replaced by the new one
+            old_mean = self.mean
+            self.mean += (value - leaving) / self.n
+            self.m2 += (value - leaving) * (value - self.mean + leaving - old_mean)
+        return self
+
+    @property
+    def full(self):
+        return self.n == self.window
+
+    def mean_value(self):
+        return self.mean if self.full else np.nan
+
+    def std_value(self):
+        return np.sqrt(max(self.m2, 0) / (self.n - 1)) if self.full else np.nan
+
+class StreamingIndicators:
+    def __init__(self):
+        # Last opens needed by the rolling windows, the log returns and the rates of change
+        self.opens = deque(maxlen=61)
+        self.rolling = {w: StreamingRolling(w) for w in (5, 20, 21, 30, 60)}
+        # MACD
+        self.ema_26 = StreamingEWM(2 / 27)
+        self.ema_12 = StreamingEWM(2 / 13)
+        # Exponential weighted moving average (com=0.9)
+        self.ewma = StreamingEWM(1 / 1.9)
+        # RSI(14) on the open, the first bar has no change
+        self.up_avg = StreamingEWM(1 / 14, min_periods=14)
+        self.down_avg = StreamingEWM(1 / 14, min_periods=14)
+        # DEMA: EMA and EMA of the EMA (adjust=False) for 20 and 50 periods
+        self.dema = {span: (StreamingEWM(2 / (span + 1), adjust=False), StreamingEWM(2 / (span + 1), adjust=False)) for span in (20, 50)}
+        self.row = None
+        self.n_bars = 0
+
+    # -- Adds a new bar and returns its feature row (in the FEATURES order, NaN where the lookback is not complete) -- #
+    def update(self, open, high, low, volume):
+        opens = self.opens
+        opens.append(open)
+        self.n_bars += 1
+        f = {'low': low, 'high': high, 'open': open, 'volume': volume}
+
+        for w, roll in self.rolling.items():
+            roll.update(open, opens[-w - 1] if roll.full else None)
+        f['ma5'] = self.rolling[5].mean_value()
+        f['ma20'] = self.rolling[20].mean_value()
+        f['ma30'] = self.rolling[30].mean_value()
+        f['ma60'] = self.rolling[60].mean_value()
+        f['26ema'] = self.ema_26.update(open)
+        f['12ema'] = self.ema_12.update(open)
+        f['MACD'] = f['12ema'] - f['26ema']
+        f['20sd'] = self.rolling[21].std_value()
+        f['upper_band'] = f['ma20'] + (f['20sd'] * 2)
+        f['lower_band'] = f['ma20'] - (f['20sd'] * 2)
+        f['ewma'] = self.ewma.update(open)
+
+        if len(opens) > 1:
+            change = open - opens[-2]
+            self.up_avg.update(change if change > 0 else 0.)
+            self.down_avg.update(change if change < 0 else 0.)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.abs(np.float64(self.up_avg.value) / self.down_avg.value)
+            f['RSI'] = 100 - 100 / (1 + rs)
+
+        for lag in range(1, 6):
+            # Same operations as log1p(pct_change(lag))
+            f[f'log_ret_{lag}'] = np.log1p(open / opens[-lag - 1] - 1) if len(opens) > lag else np.nan
+        f['cum_log_ret_3'] = f['log_ret_1'] + f['log_ret_2'] + f['log_ret_3']
+        f['cum_log_ret_5'] = f['cum_log_ret_3'] + f['log_ret_4'] + f['log_ret_5']
+        f['diff_cum_log_ret'] = f['cum_log_ret_5'] - f['cum_log_ret_3']
+        f['ROC_9'] = open - opens[-10] if len(opens) > 9 else np.nan
+        f['ROC_14'] = open - opens[-15] if len(opens) > 14 else np.nan
+
+        for name, span in (('DEMA_short', 20), ('DEMA_long', 50)):
+            ema, ema_ema = self.dema[span]
+            value = ema.update(open)
+            f[name] = 2 * value - ema_ema.update(value)
+        f['momentum'] = open - 5
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f['log_momentum'] = np.log(f['momentum'])
+
+        self.row = np.array([f[name] for name in FEATURES], dtype=np.float64)
+        return self.row
+
+    # -- Feature row of the last bar, None until all the indicators have their full lookback -- #
+    def features(self):
+        if self.row is None or np.isnan(self.row).any():
+            return None
+        return self.row
+
+# Relative error tolerated between the streaming and the batch indicators. The rolling windows of pandas and of StreamingRolling
+# accumulate rounding errors differently, about 1e-9 over a few thousand bars and 7e-9 over 20k bars
+PARITY_TOLERANCE = 1e-7
+
+# -- Feeds bars one by one and compares the rows with get_technical_indicators run on the whole frame, returns the max relative error -- #
+def parity_check(n_rows=5_000, seed=0, tolerance=PARITY_TOLERANCE):
+    import pandas as pd
+    from TechnicalIndicator import get_technical_indicators
+    rng = np.random.default_rng(seed)
+    close = 40_000 * np.exp(np.cumsum(rng.normal(0, 1e-3, n_rows)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    bars = pd.DataFrame({
+        'volume': rng.uniform(1, 100, n_rows),
+        'open': open_,
+        'low': np.minimum(open_, close) * 0.999,
+        'high': np.maximum(open_, close) * 1.001,
+        'close': close,
+    })
+    batch = get_technical_indicators(bars.copy())[FEATURES].values
+    indicators = StreamingIndicators()
+    stream = np.array([indicators.update(*bar) for bar in bars[['open', 'high', 'low', 'volume']].itertuples(index=False)])
+    if not np.array_equal(np.isnan(batch), np.isnan(stream)):
+        raise AssertionError('The streaming and batch indicators are not defined on the same bars')
+    valid = ~np.isnan(batch)
+    scale = np.maximum(np.abs(batch[valid]), 1)
+    error = (np.abs(stream[valid] - batch[valid]) / scale).max()
+    if error > tolerance:
+        raise AssertionError(f'Streaming indicators differ from get_technical_indicators (max relative error {error})')
+    return error
+
+if __name__ == '__main__':
+    print(f"Max relative error against get_technical_indicators: {parity_check()}")
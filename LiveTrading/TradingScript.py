@@ -1,14 +1,19 @@
 from Processor import Processor
-from TechnicalIndicator import get_technical_indicators
-from DeribitWS import DeribitWS
-import pandas as pd
+import SharedModules # Shared folder in the path
+from TechnicalIndicator import feature_graph, FEATURES
+from StreamingIndicator import StreamingIndicators
+from ModelRegistry import ModelRegistry
+from MarketData import BarStream, resolution_ms
+from BarBuffer import BarBuffer
+from Scheduler import BarScheduler
+from Metrics import metrics
 import numpy as np
-from tensorflow import keras
 from datetime import datetime 
+import os
+import sys
 import time
 import json
 from termcolor import colored
-from pickle import load
 
 with open('./auth_creds.json') as j:
     creds = json.load(j)
@@ -18,72 +23,97 @@ client_secret = creds['real']['client_secret'] # Mainnet -> 'real', Testnet -> '
 
 
 class TradingScript(Processor):
-    def __init__(self, client_id, client_secret, instrument, timeframe, trade_capital, max_holding, ub_mult, lb_mult, entry_cond, lookback, n, live):
+    def __init__(self, client_id, client_secret, instrument, timeframe, trade_capital, max_holding, ub_mult, lb_mult, entry_cond, lookback, n, live, model='test_69'):
         super().__init__(client_id, client_secret, instrument, timeframe, trade_capital, max_holding, ub_mult, lb_mult, live)
 
         self.entry_cond = entry_cond
         self.lookback = lookback
         self.n = n
-        self.delta = 60_000 # Milliseconds -> 60'000 equals to 1 min
-        self.WS = DeribitWS(client_id, client_secret, live)
-
-    def data_validation(self, data):
-        df = data.copy()
-        # Change timestamp column to datetime 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        # Drop duplicates
-        df.drop_duplicates(subset=['timestamp'], keep='first', inplace=True)
-        df.reset_index(inplace=True)
-        keep_cols = ['volume', 'open', 'low', 'high', 'close', 'timestamp']
-        for i in df.columns:
-            if i in keep_cols:
-                pass
-            else:
-                del df[i]
-        df = get_technical_indicators(df)
-        # Reorder columns
-        columns_titles = ['timestamp','open','low','high','close','volume','ma5','ma20','ma30','ma60','26ema','12ema','MACD','20sd','upper_band','lower_band','ema','RSI','log_ret_1','log_ret_2','log_ret_3','log_ret_4','log_ret_5','cum_log_ret_3','cum_log_ret_5','diff_cum_log_ret','ROC_9','ROC_14','DEMA_short','DEMA_long','momentum','log_momentum']
-        df=df.reindex(columns=columns_titles)
-        # Selecting features
-        features = ['low','high','open','volume','ma5','ma20','ma30','ma60','26ema','12ema','MACD','20sd','upper_band','lower_band','ema','RSI','log_ret_1','log_ret_2','log_ret_3','log_ret_4','log_ret_5','cum_log_ret_3','cum_log_ret_5','diff_cum_log_ret','ROC_9','ROC_14','DEMA_short','DEMA_long','momentum','log_momentum']
-        df = df.dropna()
-        # Load the scaler
-        scaler = load(open('../LSTM_MinMaxModels/MinMaxModel_test_69.pkl', 'rb'))
-        # Add the scaler to the dataframe
-        feature_transform = scaler.transform(df[features])
-        feature_transform = pd.DataFrame(columns=features, data=feature_transform, index=df.index)
-        df = feature_transform
-        df = np.array(df)
-        df = df.reshape(df.shape[0], 1, df.shape[1])
-        return df
-
-    def generate_signal(self, data,lstm):
-        previously = data.close.values.reshape(-1, 1)
-        y = self.data_validation(data)
-        pred = lstm(y)
+        # Last bars (a day at least), appended in place and read as views by the indicator and model stages
+        self.bars = BarBuffer(max(lookback + 1, 1440))
+        # Indicators updated with the new bars only, the first call is fed with the whole lookback
+        self.indicators = StreamingIndicators()
+        self.fed = 0 # Bars of the buffer already fed to the indicators
+        # Model and scaler loaded (and warmed up) once, reloaded only when their files change
+        self.models = ModelRegistry()
+        self.models.register(model, default=True)
+
+    # -- Feeds the bars appended to the buffer since the last call to the streaming indicators -- #
+    def feed_indicators(self):
+        new = min(self.bars.n - self.fed, len(self.bars))
+        if new:
+            for bar in zip(*(self.bars.column(field, new).tolist() for field in ('open', 'high', 'low', 'volume'))):
+                self.indicators.update(*bar)
+        self.fed = self.bars.n
+
+    # -- Feeds the new bars to the streaming indicators and returns the scaled features of the last bar, None if the lookback is not complete -- #
+    def update_features(self, lstm):
+        with metrics.span('features'):
+            self.feed_indicators()
+            row = self.indicators.features()
+        if row is None:
+            return None
+        with metrics.span('scaling'):
+            return lstm.scale(row.reshape(1, -1))
+
+    # -- Signal of the scaled features of the last bar: 1 (-1) if the predicted close is entry_cond above (below) the last one -- #
+    def predict_signal(self, y, last, lstm):
+        # Prediction of the close of the next bar (Keras tensor or numpy array of shape (1, 1))
+        with metrics.span('inference'):
+            pred = float(np.asarray(lstm(y))[0, 0])
         now = datetime.now()
         dt_string = now.strftime('%d/%m/%Y %H:%M:%S') # Generate a readable time format
-        print(colored(f'{dt_string}', 'cyan', attrs=['bold']), f"Predicted: {int(pred)}, Last: {int(previously[-1])}")
-        if (pred / previously[-1] - 1) > self.entry_cond:
+        print(colored(f'{dt_string}', 'cyan', attrs=['bold']), f"Predicted: {int(pred)}, Last: {int(last)}")
+        if (pred / last - 1) > self.entry_cond:
             return 1
-        elif (pred / previously[-1] - 1) < -self.entry_cond:
+        elif (pred / last - 1) < -self.entry_cond:
             return -1
         else:
             return 0
 
-    def get_data(self):
-        end = self.utc_times_now()
-        start = end - self.delta*self.lookback
-        json_resp = self.WS.get_data(self.instrument, start, end, self.timeframe)
-        if 'error' in json_resp.keys():
-            print(colored(json_resp['error'],'red'))
-            return False, False
-        elif 'result' in json_resp.keys():
-            data = self.json_to_dataframe(json_resp)
-            return True, data
-        else:
-            return False, False # False, do we have data -> false
+    # -- Appends a closed bar of the stream to the buffer, False if it was already seen -- #
+    def add_bar(self, bar):
+        return self.bars.append(bar['ticks'], *(bar[field] for field in self.bars.fields))
 
+    # -- Decision on a closed bar: opens a position on a signal or monitors the open one -- #
+    # Bars past their deadline (the lookback and the bars backfilled after a gap) do not open positions (decide=False), they
+    # update the indicators and still count for the barriers and the holding time of the open position
+    def on_bar(self, bar, initial_equity, decide=True):
+        t = time.time()
+        if not self.add_bar(bar):
+            return
+        if not decide:
+            self.feed_indicators()
+            if self.open_pos:
+                self.monitor_open(bar['close'], initial_equity)
+            return
+        # Time between the close of the bar and the start of its decision (delivery by the stream and scheduling)
+        metrics.record('bar_delay', t - (bar['ticks'] + resolution_ms(self.timeframe)) / 1000)
+        lstm = self.models.get()
+        # Feeds the bar to the streaming indicators and scales its features
+        y = self.update_features(lstm)
+        signal = 0 if y is None else self.predict_signal(y, bar['close'], lstm)
+        metrics.record('signal', time.time() - t)
+        self.act(signal, bar['close'], initial_equity, t)
+        metrics.record('bar', time.time() - t)
+
+    # -- Bars from start to end (ticks) are lost: the indicators restart from the next bar and no decision is taken before their lookback is complete -- #
+    def on_gap(self, start, end):
+        self.indicators = StreamingIndicators()
+        self.fed = self.bars.n
+        print(colored(f'Indicators reset after the lost bars, no signal for the next {self.lookback} bars', 'yellow'))
+
+    def act(self, signal, last_price, initial_equity, t):
+        if signal == 1 and self.open_pos is False:
+            self.open_long()
+            print(colored(f"Took {time.time()-t} seconds to execute",'yellow'))
+        elif signal == -1 and self.open_pos is False:
+            self.open_short()
+            print(colored(f"Took {time.time() - t} seconds to execute", 'yellow'))
+        elif self.open_pos:
+            self.monitor_open(last_price, initial_equity)
+        else:
+            pass
 
     def run(self, endtime):
         print('\n\n')
@@ -100,35 +130,23 @@ class TradingScript(Processor):
         dt_string = now.strftime('%d/%m/%Y %H:%M:%S') # Generate a readable time format
         initial_equity = self.WS.account_summary('BTC')["result"]["equity"]
         print(colored(f"Started strategy at {dt_string} with {initial_equity} BTC equity",'magenta'), '\n')
-        while True:
-            timenow = datetime.now()
-            if timenow.second == 0:
-                t = time.time()
-                good_call, data = self.get_data()
-                if not good_call:
-                    time.sleep(1)
-                    continue
-                last_price = data.close.values[-1]
-                lstm = keras.models.load_model('../LSTM_Models/test_69.h5')
-                signal = self.generate_signal(data,lstm)
-
-                if signal == 1 and self.open_pos is False:
-                    self.open_long()
-                    print(colored(f"Took {time.time()-t} seconds to execute",'yellow'))
-                elif signal == -1 and self.open_pos is False:
-                    self.open_short()
-                    print(colored(f"Took {time.time() - t} seconds to execute", 'yellow'))
-                elif self.open_pos:
-                    self.monitor_open(last_price, initial_equity)
-                else:
-                    pass
-                time.sleep(1)
-
-            if timenow >= endtime:
-                print(colored(f"Exiting strategy at {dt_string}", 'blue'))
-                if self.open_pos:
-                    self.close_position(initial_equity)
-                break
+        # Closed bars pushed by the subscriptions: the lookback is backfilled first, then every bar arrives as soon as it closes
+        # and is decided once, in a worker thread, within the deadline of the scheduler
+        # A gap that cannot be backfilled resets the indicators
+        scheduler = BarScheduler(resolution_ms(self.timeframe), lambda bar, decide: self.on_bar(bar, initial_equity, decide), on_gap=self.on_gap)
+        stream = BarStream(self.WS.session, self.instrument, self.timeframe, scheduler.put, on_gap=scheduler.put_gap)
+        start = int(self.utc_times_now()) - resolution_ms(self.timeframe) * (self.lookback + 1)
+        scheduler.run(endtime, start=lambda: self.WS.run_async(stream.start(start=start)))
+        if scheduler.missed or scheduler.overruns:
+            print(colored(f"{len(scheduler.missed)} bars missed, {len(scheduler.overruns)} decisions over the deadline", 'yellow'))
+        if metrics.enabled:
+            print(colored('Latency of the stages:', 'yellow'), *metrics.report(), sep='\n')
+            metrics.dump()
+
+        dt_string = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        print(colored(f"Exiting strategy at {dt_string}", 'blue'))
+        if self.open_pos:
+            self.close_position(initial_equity)
 
 if __name__ == '__main__':
     instrument = 'BTC-PERPETUAL'
@@ -139,7 +157,13 @@ if __name__ == '__main__':
     max_holding = 55 # Minutes
     entry_cond = 0.03
     n = 3
-    lookback = 59
+    lookback = feature_graph(FEATURES).lookback # Bars before the first row where all the features are defined (59)
+    # --metrics writes the latency histograms of the stages every minute in the Prometheus text format next to this script,
+    # metrics_port also serves them over HTTP
+    if '--metrics' in sys.argv:
+        metrics_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.prom')
+        metrics_port = None
+        metrics.enable(path=metrics_path, interval=60, port=metrics_port)
 
     strat = TradingScript(client_id, client_secret, instrument, timeframe, trade_capital, max_holding, ub_mult, lb_mult, entry_cond, lookback, n, live=True) # To use mainnet just put live=True
 
@@ -0,0 +1,182 @@
+import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from TechnicalIndicator import FEATURES
+from NumpyLSTM import NumpyModel, load_keras
+
+# ---- Registry of the LSTM models and of their MinMax scalers ---- #
+# Every model is loaded once with its scaler and warmed up with a dummy inference, so the first real prediction does not
+# pay the initialisation of the model. Several versions can be resident at the same time, each one under its name.
+# When the model or the scaler file of a version changes on disk it is reloaded the next time the version is requested,
+# the previous version keeps being used until the new one is completely loaded (and if its files cannot be loaded).
+# Models exported to .npz (NumpyLSTM.export_npz) are run with numpy, tensorflow is only needed for the .h5 ones.
+
+MODELS_DIR = '../LSTM_Models'
+SCALERS_DIR = '../LSTM_MinMaxModels'
+
+# -- Paths of the model (its .npz export if there is one) and of the scaler saved under a name (e.g. test_69) -- #
+def model_paths(name):
+    model_path = os.path.join(MODELS_DIR, f'{name}.npz')
+    if not os.path.isfile(model_path):
+        model_path = os.path.join(MODELS_DIR, f'{name}.h5')
+    return model_path, os.path.join(SCALERS_DIR, f'MinMaxModel_{name}.pkl')
+
+# -- Size and modification time of a file, it is reloaded when they change -- #
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+# -- NumpyModel of a .npz export, Keras model otherwise (tensorflow is only imported then) -- #
+def load_model(path):
+    if path.endswith('.npz'):
+        return NumpyModel(path)
+    return load_keras(path)
+
+def load_scaler(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+# -- A loaded model with its scaler -- #
+class ModelVersion:
+    def __init__(self, name, model_path, scaler_path, model, scaler, stamps):
+        self.name = name
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.model = model
+        self.scaler = scaler
+        self.stamps = stamps
+        self.n_features = getattr(scaler, 'n_features_in_', len(FEATURES))
+
+    # -- Scales a (n, n_features) feature matrix, returns it with the (n, 1, n_features) shape of the LSTM input -- #
+    def scale(self, features):
+        if hasattr(self.scaler, 'min_') and hasattr(self.scaler, 'scale_'):
+            # MinMaxScaler: same operations as its transform, without the validation of the input nor a DataFrame
+            features = np.asarray(features)
+            features = np.array(features, dtype=features.dtype if features.dtype.kind == 'f' else np.float64)
+            features *= self.scaler.scale_
+            features += self.scaler.min_
+            if getattr(self.scaler, 'clip', False):
+                np.clip(features, *self.scaler.feature_range, out=features)
+        else:
+            names = getattr(self.scaler, 'feature_names_in_', None)
+            # The scaler was fitted on a dataframe, its columns are given to avoid the feature names warning
+            features = self.scaler.transform(pd.DataFrame(features, columns=names, copy=False) if names is not None else features)
+        return features.reshape(features.shape[0], 1, features.shape[1])
+
+    # -- Predictions of the model for scaled inputs -- #
+    def __call__(self, inputs):
+        return self.model(inputs)
+
+    # -- Predictions for a (n, n_features) feature matrix, scaled and run by batches of batch_size rows -- #
+    # Only one batch per worker is scaled at a time and the predictions are written into a preallocated float32 (n, n_outputs)
+    # array, so the memory does not grow with the number of rows (a memory-mapped matrix is read batch by batch).
+    # With n_workers > 1 the batches run on a thread pool, numpy and tensorflow release the GIL in their kernels.
+    def predict(self, features, batch_size=16_384, n_workers=1):
+        n = len(features)
+        starts = range(0, n, batch_size)
+        run = lambda start: np.asarray(self(self.scale(features[start:start + batch_size])), dtype=np.float32)
+        if n == 0:
+            return np.empty((0, 1), dtype=np.float32)
+        # The first batch gives the shape of the outputs
+        first = run(0)
+        out = np.empty((n, *first.shape[1:]), dtype=np.float32)
+        out[:len(first)] = first
+        def write(start):
+            out[start:start + batch_size] = run(start)
+        if n_workers > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                # list() raises the exceptions of the workers
+                list(pool.map(write, starts[1:]))
+        else:
+            for start in starts[1:]:
+                write(start)
+        return out
+
+    # -- Runs a dummy inference so the model builds its graph before the first real prediction -- #
+    def warmup(self):
+        self(self.scale(np.zeros((1, self.n_features), dtype=np.float32)))
+        return self
+
+class ModelRegistry:
+    def __init__(self, load_model=load_model, load_scaler=load_scaler, warmup=True):
+        self.load_model = load_model
+        self.load_scaler = load_scaler
+        self.warmup = warmup
+        self.versions = {}
+        self.default = None
+        self.lock = threading.Lock()
+
+    # -- Loads a version, the paths default to the ones of the models saved under its name -- #
+    def register(self, name, model_path=None, scaler_path=None, default=False):
+        default_model, default_scaler = model_paths(name)
+        version = self.load(name, model_path or default_model, scaler_path or default_scaler)
+        with self.lock:
+            self.versions[name] = version
+            if default or self.default is None:
+                self.default = name
+        return version
+
+    def load(self, name, model_path, scaler_path):
+        stamps = (file_stamp(model_path), file_stamp(scaler_path))
+        version = ModelVersion(name, model_path, scaler_path, self.load_model(model_path), self.load_scaler(scaler_path), stamps)
+        return version.warmup() if self.warmup else version
+
+    # -- Returns a resident version (the default one if no name is given), reloaded first if its files changed -- #
+    def get(self, name=None):
+        name = self.default if name is None else name
+        if name not in self.versions:
+            raise KeyError(f'Model {name} is not registered')
+        version = self.versions[name]
+        try:
+            stamps = (file_stamp(version.model_path), file_stamp(version.scaler_path))
+        except OSError:
+            # The files are being replaced, the resident version is kept
+            return version
+        if stamps == version.stamps:
+            return version
+        with self.lock:
+            version = self.versions[name]
+            if stamps != version.stamps:
+                try:
+                    version = self.versions[name] = self.load(name, version.model_path, version.scaler_path)
+                    print(f'Model {name} reloaded')
+                except Exception as e:
+                    # Probably a file still being written, it is retried at the next request
+                    print(f'Model {name} could not be reloaded ({e}), the previous version is kept')
+        return version
+
+    def unregister(self, name):
+        with self.lock:
+            del self.versions[name]
+            if self.default == name:
+                self.default = next(iter(self.versions), None)
+
+    def __contains__(self, name):
+        return name in self.versions
+
+    def names(self):
+        return list(self.versions)
+
+# Registry shared by the strategies of the process
+registry = ModelRegistry()
+
+# -- (name, model_path, scaler_path) of a model given by its name or by a (model_path, scaler_path) pair (named after the model file) -- #
+def model_spec(model):
+    if isinstance(model, str):
+        return model, None, None
+    model_path, scaler_path = model
+    return os.path.splitext(os.path.basename(model_path))[0], model_path, scaler_path
+
+# -- Version called name from the shared registry, loaded the first time it is requested (from the paths saved under the name by default) -- #
+# The paths given for a name that is already registered must be the ones it was loaded from
+def get_model(name='test_69', model_path=None, scaler_path=None):
+    if name not in registry:
+        registry.register(name, model_path, scaler_path)
+    version = registry.get(name)
+    for path, loaded in ((model_path, version.model_path), (scaler_path, version.scaler_path)):
+        if path is not None and os.path.abspath(path) != os.path.abspath(loaded):
+            raise ValueError(f'Model {name} is already registered with {loaded}, not {path}')
+    return version
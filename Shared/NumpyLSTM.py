@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import numpy as np
+
+# ---- Forward pass of the Keras LSTM models with numpy only ---- #
+# export_npz extracts the configuration and the weights of a Sequential model saved as .h5 (InputLayer, LSTM and Dense layers)
+# into a .npz file. NumpyModel runs the same forward pass on it, so predictions do not need tensorflow (nor h5py) at runtime.
+# Keras LSTM cells: z = x @ kernel + h @ recurrent_kernel + bias, split in the input, forget, cell and output gates (in this order).
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    # Same function as 1 / (1 + exp(-x)) without overflow for large negative inputs
+    'sigmoid': lambda x: 0.5 * (1 + np.tanh(0.5 * x)),
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+}
+
+# -- Path of the .npz export of a model (next to the .h5 file) -- #
+def npz_path(h5_path):
+    return os.path.splitext(h5_path)[0] + '.npz'
+
+# -- Writes the layers and the weights of a .h5 Keras model into a .npz file, returns its path -- #
+def export_npz(h5_path, path=None):
+    import h5py
+    path = path or npz_path(h5_path)
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        weights = f['model_weights']
+        arrays = {}
+        for name in weights.attrs['layer_names']:
+            name = name.decode() if isinstance(name, bytes) else name
+            layer = weights[name]
+            for weight in layer.attrs['weight_names']:
+                weight = weight.decode() if isinstance(weight, bytes) else weight
+                # e.g. lstm/lstm_cell/recurrent_kernel:0 -> lstm/recurrent_kernel
+                arrays[f"{name}/{weight.split('/')[-1].split(':')[0]}"] = np.asarray(layer[weight], dtype=np.float32)
+    layers = []
+    for layer in config['config']['layers']:
+        if layer['class_name'] not in ('InputLayer', 'LSTM', 'Dense'):
+            raise ValueError(f"Layer {layer['class_name']} is not supported by NumpyModel")
+        layers.append({'class_name': layer['class_name'], 'config': layer['config']})
+    tmp = f'{path}.tmp{os.getpid()}.npz'
+    np.savez(tmp, layers=np.array(json.dumps(layers)), **arrays)
+    os.replace(tmp, path)
+    return path
+
+class NumpyModel:
+    def __init__(self, path):
+        with np.load(path) as f:
+            self.layers = json.loads(str(f['layers']))
+            self.weights = {k: f[k] for k in f.files if k != 'layers'}
+        for layer in self.layers:
+            config = layer['config']
+            if layer['class_name'] == 'LSTM' and (config.get('go_backwards') or config.get('stateful') or config.get('return_state')):
+                raise ValueError(f"LSTM layer {config['name']} options are not supported by NumpyModel")
+
+    # -- Predictions for inputs of shape (n, timesteps, n_features), same output shape as the Keras model -- #
+    def __call__(self, inputs):
+        x = np.asarray(inputs, dtype=np.float32)
+        for layer in self.layers:
+            config = layer['config']
+            if layer['class_name'] == 'LSTM':
+                x = self.lstm(x, config)
+            elif layer['class_name'] == 'Dense':
+                x = ACTIVATIONS[config['activation']](x @ self.weights[f"{config['name']}/kernel"] + self.bias(config))
+        return x
+
+    def bias(self, config):
+        return self.weights[f"{config['name']}/bias"] if config.get('use_bias', True) else 0
+
+    def lstm(self, x, config):
+        name, units = config['name'], config['units']
+        activation = ACTIVATIONS[config['activation']]
+        recurrent_activation = ACTIVATIONS[config['recurrent_activation']]
+        recurrent_kernel = self.weights[f'{name}/recurrent_kernel']
+        n, timesteps, _ = x.shape
+        # Input part of the gates of all the timesteps in one product
+        z_x = x @ self.weights[f'{name}/kernel'] + self.bias(config)
+        h = np.zeros((n, units), dtype=np.float32)
+        c = np.zeros((n, units), dtype=np.float32)
+        outputs = []
+        for t in range(timesteps):
+            # The initial state is zero, the recurrent product of the first timestep is skipped
+            z = z_x[:, t] if t == 0 else z_x[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            c = f * c + i * activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            h = o * activation(c)
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if config.get('return_sequences') else h
+
+# -- Loads a .h5 model with Keras, including the ones saved by Keras 2 whose LSTM config has time_major (refused by Keras 3) -- #
+def load_keras(h5_path):
+    from tensorflow import keras
+    class LSTM(keras.layers.LSTM):
+        # time_major is False in the saved models, the inputs are (n, timesteps, n_features)
+        def __init__(self, *args, time_major=False, **kwargs):
+            super().__init__(*args, **kwargs)
+    return keras.models.load_model(h5_path, compile=False, custom_objects={'LSTM': LSTM})
+
+# -- Compares NumpyModel with the Keras model on random inputs, returns the max difference relative to the largest prediction -- #
+def equivalence_check(h5_path, path=None, n_rows=10_000, seed=0, tolerance=1e-5):
+    keras_model = load_keras(h5_path)
+    model = NumpyModel(path or npz_path(h5_path))
+    batch_input_shape = model.layers[0]['config'].get('batch_input_shape') or model.layers[0]['config']['batch_shape']
+    rng = np.random.default_rng(seed)
+    # Scaled features are in [0, 1], a bit wider to also cover values outside of the training range
+    inputs = rng.uniform(-0.25, 1.25, (n_rows, *batch_input_shape[1:])).astype(np.float32)
+    expected = np.asarray(keras_model(inputs))
+    result = model(inputs)
+    # Both run in float32, the predictions (prices) only differ by the rounding of the operations
+    error = np.abs(result - expected).max() / max(np.abs(expected).max(), 1)
+    if result.shape != expected.shape or error > tolerance:
+        raise AssertionError(f'NumpyModel differs from the Keras model (shapes {result.shape} {expected.shape}, relative error {error})')
+    return error
+
+if __name__ == '__main__':
+    h5_path = sys.argv[1] if len(sys.argv) > 1 else '../LSTM_Models/test_69.h5'
+
+    print(f"Exported {export_npz(h5_path)}")
+    print(f"Max relative difference with Keras: {equivalence_check(h5_path)}")
@@ -0,0 +1,378 @@
+import numpy as np
+
+# ---- All the technical indicators calculated here ---- #
+# List of technical indicators: 
+# - Moving average for 5, 20, 30 and 60 minutes
+# - Moving Average Convergence Divergence (MACD), that utilizes the 12 and 26 period Exponential Moving Average (EMA)
+# - Bollinger Bands (BB), that utilize the 20 period Standard Deviation and the calculated upper and lower bands
+# - Exponential moving average
+# - Relative strength Index (RSI)
+# - Log returns for various time-windows
+# - Cumulative sum of last 3 and 5 minutes of log-returns
+# - Difference between cumulative sum of last 3 and 5 minutes of log-returns
+# - Rate of Change (ROC) for 9 and 14 minutes period
+# - Double Exponential Moving Average (DEMA)
+# - Momentum indicators
+
+# -- Relative Strength Index (RSI) indicator -- #
+def compute_RSI (data, time_window):
+    diff = data.diff(1).dropna() # Diff in one field(one day)
+    # This preservers dimensions of different values
+    up_chg = 0 * diff
+    down_chg = 0 * diff
+    # Up change is equal to the positive difference, otherwise equal to zero
+    up_chg[diff > 0] = diff[ diff>0 ]
+    # Down change is equal to negative deifference, otherwise equal to zero
+    down_chg[diff < 0] = diff[ diff < 0 ]
+    # Set com=time_window-1 so get decay alpha=1/time_window
+    up_chg_avg   = up_chg.ewm(com=time_window-1 , min_periods=time_window).mean()
+    down_chg_avg = down_chg.ewm(com=time_window-1 , min_periods=time_window).mean()
+    rs = abs(up_chg_avg/down_chg_avg)
+    rsi = 100 - 100/(1+rs)
+    return rsi
+
+# -- Williams' %R indicator -- #
+def compute_WilliamsR(high, low, close, lookback):
+    highh = high.rolling(lookback).max() 
+    lowl = low.rolling(lookback).min()
+    wr = -100 * ((highh - close) / (highh - lowl))
+    return wr
+
+# -- Log-Returns indicator -- #
+def compute_Log_Return(data, lag):
+    return np.log1p(data.open.pct_change(lag)).rename('log_return')
+
+# -- Double Exponential Moving Average (DEMA) -- #
+def DEMA(data, time_period):
+    # Calculate the DEMA for some time_period (in days)
+    EMA = data['open'].ewm(span=time_period, adjust=False).mean()
+    # Calculate the DEMA
+    DEMA = 2*EMA - EMA.ewm(span=time_period, adjust=False).mean()
+    return DEMA
+
+# -- Add all the technical indicators to the dataset (and some of them are calculated directly here for simplicity purposes) -- #
+def get_technical_indicators(dataset):
+    # Create 5, 20, 30 and 60 min Moving Average
+    dataset['ma5'] = dataset['open'].rolling(window=5).mean()
+    dataset['ma20'] = dataset['open'].rolling(window=20).mean()
+    dataset['ma30'] = dataset['open'].rolling(window=30).mean()
+    dataset['ma60'] = dataset['open'].rolling(window=60).mean()
+    # Create MACD
+    dataset['26ema'] = dataset['open'].ewm(span=26).mean()
+    dataset['12ema'] = dataset['open'].ewm(span=12).mean()
+    dataset['MACD'] = dataset['12ema']-dataset['26ema']
+    # Create Bollinger Bands
+    dataset['20sd'] = dataset['open'].rolling(window = 21).std()
+    dataset['upper_band'] = dataset['ma20'] + (dataset['20sd']*2)
+    dataset['lower_band'] = dataset['ma20'] - (dataset['20sd']*2)
+    # Create Exponential Weighted Moving Average
+    dataset['ewma'] = dataset['open'].ewm(com=0.9).mean()
+    # Create RSI
+    dataset['RSI'] = compute_RSI(dataset['open'], 14)
+    # Create Williams' %R
+    dataset['wr_14'] = compute_WilliamsR(dataset['high'], dataset['low'], dataset['close'], 14)
+    # Create Log-Returns
+    dataset['log_ret_1'] = compute_Log_Return(dataset, 1)
+    dataset['log_ret_2'] = compute_Log_Return(dataset, 2)
+    dataset['log_ret_3'] = compute_Log_Return(dataset, 3)
+    dataset['log_ret_4'] = compute_Log_Return(dataset, 4)
+    dataset['log_ret_5'] = compute_Log_Return(dataset, 5)
+    # Create cumulative sum of last 3 and 5 minutes of log-returns, summed by name: a positional slice of the columns depends on
+    # the layout of the input (the live bars have other columns than the csv and summed log_ret_2..3 instead of log_ret_1..3)
+    dataset['cum_log_ret_3'] = dataset['log_ret_1'] + dataset['log_ret_2'] + dataset['log_ret_3']
+    dataset['cum_log_ret_5'] = dataset['cum_log_ret_3'] + dataset['log_ret_4'] + dataset['log_ret_5']
+    # Create difference between cumulative sum of last 3 and 5 minutes of log-returns
+    dataset['diff_cum_log_ret'] = (dataset['cum_log_ret_5'] - dataset['cum_log_ret_3'])
+    # Create Rate of Change (ROC) for 9 and 14 minutes period
+    dataset['ROC_9'] = dataset['open'].diff(9)
+    dataset['ROC_14'] = dataset['open'].diff(14)
+    # Create Double Exponential Moving Average (DEMA)
+    dataset['DEMA_short'] = DEMA(dataset, 20)
+    dataset['DEMA_long'] = DEMA(dataset, 50)
+    # Create Momentum
+    dataset['momentum'] = dataset['open']-5
+    dataset['log_momentum'] = np.log(dataset['momentum'])
+    return dataset
+
+# ---- Same features as get_technical_indicators computed with numpy straight into a float32 (n, n_features) matrix ---- #
+# Every feature (and every intermediate shared by several features) is a node of a registry with its inputs and its
+# warm-up, the number of bars before its first value. FeatureGraph resolves the nodes needed by a list of features,
+# so only those are computed (each once), and gives the lookback needed before the first row where all are defined.
+# The rows are computed by chunks: the exponential averages are carried from one chunk to the next and the rolling
+# windows only need the last bars of the previous chunk, so the temporary arrays have the size of a chunk.
+# The inputs used by the exponential averages (the open) must not contain NaN (as after the DataManager dropna).
+
+# Features of the LSTM model, in the order used by the MinMax scaler
+FEATURES = ['low','high','open','volume','ma5','ma20','ma30','ma60','26ema','12ema','MACD','20sd','upper_band','lower_band','ewma','RSI','log_ret_1','log_ret_2','log_ret_3','log_ret_4','log_ret_5','cum_log_ret_3','cum_log_ret_5','diff_cum_log_ret','ROC_9','ROC_14','DEMA_short','DEMA_long','momentum','log_momentum']
+# Other names of the same features (the live scripts call ewma ema)
+ALIASES = {'ema': 'ewma'}
+BARS = ('open', 'high', 'low', 'close', 'volume')
+
+# Powers w^k and w^-k used by _recurrence, by decay factor w
+_powers = {}
+
+# -- y[t] = w * y[t-1] + x[t] with y[-1] = y0, computed by blocks short enough for w ** -block not to overflow -- #
+def _recurrence(x, w, y0=0.):
+    y = np.empty(len(x))
+    block = max(1, int(500 / -np.log(w))) if 0 < w < 1 else 1
+    if w not in _powers:
+        powers = w ** np.arange(block, dtype=np.float64)
+        with np.errstate(divide='ignore', over='ignore'):
+            _powers[w] = powers, 1 / powers
+    powers, inverse = _powers[w]
+    for s in range(0, len(x), block):
+        m = min(block, len(x) - s)
+        if block == 1:
+            y[s] = w * y0 + x[s]
+        else:
+            # y[s+k] = w^k * (w * y[s-1] + sum_j<=k x[s+j] * w^-j)
+            y[s:s + m] = powers[:m] * (w * y0 + np.cumsum(x[s:s + m] * inverse[:m]))
+        y0 = y[s + m - 1]
+    return y
+
+# -- Exponential moving average of x continuing the previous chunks (state is updated), same values as pandas ewm(...).mean() -- #
+def _ewm(x, alpha, state, adjust=True, min_periods=0):
+    w = 1 - alpha
+    nobs = state.get('nobs', 0)
+    if len(x) == 0:
+        return np.empty(0)
+    if adjust:
+        # Weighted sum of the values divided by the sum of the weights (1 - w^(t+1)) / alpha, constant once w^(t+1) is negligible
+        num = _recurrence(x, w, state.get('num', 0.))
+        state['num'] = num[-1]
+        den = np.full(len(x), 1 / alpha)
+        m = max(0, min(len(x), int(np.log(1e-18) / np.log(w)) - nobs)) if w > 0 else 0
+        den[:m] = (1 - w ** np.arange(nobs + 1, nobs + m + 1, dtype=np.float64)) / alpha
+        ema = num / den
+    else:
+        # ema[0] = x[0], then ema[t] = w * ema[t-1] + alpha * x[t]
+        scaled = alpha * x
+        if nobs == 0:
+            scaled[0] = x[0]
+        ema = _recurrence(scaled, w, state.get('last', 0.))
+        state['last'] = ema[-1]
+    state['nobs'] = nobs + len(x)
+    ema[:max(0, min_periods - 1 - nobs)] = np.nan
+    return ema
+
+# -- Same values as pd.Series(x).ewm(alpha=alpha, min_periods=min_periods).mean(), the NaN values are skipped as pandas does -- #
+def ewm_mean(x, alpha, min_periods=0):
+    x = np.asarray(x, dtype=np.float64)
+    observed = ~np.isnan(x)
+    # Weighted sums of the values and of their weights, both keep decaying over the missing values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = _recurrence(np.where(observed, x, 0.), 1 - alpha) / _recurrence(observed.astype(np.float64), 1 - alpha)
+    mean[np.cumsum(observed) < max(min_periods, 1)] = np.nan
+    return mean
+
+# -- Rolling means and sample standard deviations of the windows of x ending on its last n values, NaN where the window is incomplete -- #
+def _rolling(x, window, n, std=False):
+    out = np.full(n, np.nan)
+    if len(x) < window:
+        return out
+    # Sums of the values (and of their squares) centered on their mean to limit the rounding errors
+    center = x.mean()
+    dev = x - center
+    sums = np.cumsum(np.concatenate([[0.], dev]))
+    s1 = sums[window:] - sums[:-window]
+    if std:
+        squares = np.cumsum(np.concatenate([[0.], dev * dev]))
+        s2 = squares[window:] - squares[:-window]
+        values = np.sqrt(np.maximum(s2 - s1 * s1 / window, 0) / (window - 1))
+    else:
+        values = center + s1 / window
+    m = min(n, len(values))
+    out[n - m:] = values[len(values) - m:]
+    return out
+
+# -- Rolling max (or min) of the windows of x ending on its last n values, NaN where the window is incomplete -- #
+def _rolling_extreme(x, window, n, fn):
+    out = np.full(n, np.nan)
+    if len(x) < window:
+        return out
+    values = fn(np.lib.stride_tricks.sliding_window_view(x, window), axis=1)
+    m = min(n, len(values))
+    out[n - m:] = values[len(values) - m:]
+    return out
+
+# -- Values of ext lagged by lag bars for its last n values, NaN where they are before the first bar -- #
+def _lag(ext, n, lag):
+    out = np.full(n, np.nan)
+    m = min(n, len(ext) - lag)
+    if m > 0:
+        out[n - m:] = ext[len(ext) - lag - m:len(ext) - lag]
+    return out
+
+# Registry of the nodes: name -> inputs, warm-up and fn(ctx, state, *inputs) computing the values of a chunk
+# ctx['n'] is the length of the chunk and ctx['ext'][col] the bars of the chunk preceded by the last bars of the previous ones
+_registry = {}
+
+def register(name, inputs, warmup, fn):
+    _registry[name] = {'inputs': tuple(inputs), 'warmup': warmup, 'fn': fn}
+
+def _bar(col):
+    return lambda ctx, state: ctx['ext'][col][len(ctx['ext'][col]) - ctx['n']:]
+
+def _moving_average(window):
+    return lambda ctx, state, open: _rolling(ctx['ext']['open'], window, ctx['n'])
+
+def _exponential_average(alpha, adjust=True):
+    return lambda ctx, state, x: _ewm(x, alpha, state, adjust=adjust)
+
+def _log_return(lag):
+    # Same operations as log1p(pct_change(lag))
+    return lambda ctx, state, open: np.log1p(open / _lag(ctx['ext']['open'], ctx['n'], lag) - 1)
+
+def _rate_of_change(lag):
+    return lambda ctx, state, open: open - _lag(ctx['ext']['open'], ctx['n'], lag)
+
+# -- RSI of the changes of the open, the very first bar has no change -- #
+def _rsi(window):
+    def fn(ctx, state, open):
+        diff = open - _lag(ctx['ext']['open'], ctx['n'], 1)
+        has_diff = ~np.isnan(diff)
+        rsi = np.full(ctx['n'], np.nan)
+        if has_diff.any():
+            diff = diff[has_diff]
+            up = _ewm(np.where(diff > 0, diff, 0.), 1 / window, state.setdefault('up', {}), min_periods=window)
+            down = _ewm(np.where(diff < 0, diff, 0.), 1 / window, state.setdefault('down', {}), min_periods=window)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi[has_diff] = 100 - 100 / (1 + np.abs(up / down))
+        return rsi
+    return fn
+
+# -- Williams' %R on high, low and close -- #
+def _williams_r(window):
+    def fn(ctx, state, high, low, close):
+        highh = _rolling_extreme(ctx['ext']['high'], window, ctx['n'], np.max)
+        lowl = _rolling_extreme(ctx['ext']['low'], window, ctx['n'], np.min)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return -100 * ((highh - close) / (highh - lowl))
+    return fn
+
+def _log(ctx, state, x):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(x)
+
+for col in BARS:
+    register(col, (), 0, _bar(col))
+# Moving averages
+for w in (5, 20, 30, 60):
+    register(f'ma{w}', ['open'], w - 1, _moving_average(w))
+# MACD
+register('26ema', ['open'], 0, _exponential_average(2 / 27))
+register('12ema', ['open'], 0, _exponential_average(2 / 13))
+register('MACD', ['12ema', '26ema'], 0, lambda ctx, state, ema_12, ema_26: ema_12 - ema_26)
+# Bollinger Bands
+register('20sd', ['open'], 20, lambda ctx, state, open: _rolling(ctx['ext']['open'], 21, ctx['n'], std=True))
+register('upper_band', ['ma20', '20sd'], 0, lambda ctx, state, ma20, sd: ma20 + (sd * 2))
+register('lower_band', ['ma20', '20sd'], 0, lambda ctx, state, ma20, sd: ma20 - (sd * 2))
+# Exponential Weighted Moving Average (com=0.9)
+register('ewma', ['open'], 0, _exponential_average(1 / 1.9))
+# RSI
+register('RSI', ['open'], 14, _rsi(14))
+# Williams' %R
+register('wr_14', ['high', 'low', 'close'], 13, _williams_r(14))
+# Log-Returns and their cumulative sums
+for lag in range(1, 6):
+    register(f'log_ret_{lag}', ['open'], lag, _log_return(lag))
+register('cum_log_ret_3', ['log_ret_1', 'log_ret_2', 'log_ret_3'], 0, lambda ctx, state, r1, r2, r3: r1 + r2 + r3)
+register('cum_log_ret_5', ['cum_log_ret_3', 'log_ret_4', 'log_ret_5'], 0, lambda ctx, state, c3, r4, r5: c3 + r4 + r5)
+register('diff_cum_log_ret', ['cum_log_ret_5', 'cum_log_ret_3'], 0, lambda ctx, state, c5, c3: c5 - c3)
+# Rate of Change
+register('ROC_9', ['open'], 9, _rate_of_change(9))
+register('ROC_14', ['open'], 14, _rate_of_change(14))
+# DEMA, the EMA and the EMA of the EMA (adjust=False) are intermediate nodes
+for name, span in (('DEMA_short', 20), ('DEMA_long', 50)):
+    register(f'ema{span}_noadjust', ['open'], 0, _exponential_average(2 / (span + 1), adjust=False))
+    register(f'ema{span}_noadjust_ema', [f'ema{span}_noadjust'], 0, _exponential_average(2 / (span + 1), adjust=False))
+    register(name, [f'ema{span}_noadjust', f'ema{span}_noadjust_ema'], 0, lambda ctx, state, ema, ema_ema: 2 * ema - ema_ema)
+# Momentum
+register('momentum', ['open'], 0, lambda ctx, state, open: open - 5)
+register('log_momentum', ['momentum'], 0, _log)
+
+class FeatureGraph:
+    def __init__(self, features):
+        self.features = list(features)
+        self.nodes = [] # Nodes to compute, each after its inputs
+        self.warmup = {} # Bars before the first value of each node, including the warm-up of its inputs
+        for feature in self.features:
+            self._add(ALIASES.get(feature, feature))
+        # Bars needed before the first row where all the features are defined
+        self.lookback = max([self.warmup[ALIASES.get(f, f)] for f in self.features], default=0)
+        self.inputs = [node for node in self.nodes if node in BARS]
+
+    def _add(self, name):
+        if name in self.warmup:
+            return
+        if name not in _registry:
+            raise ValueError(f'Unknown feature {name}')
+        node = _registry[name]
+        for dep in node['inputs']:
+            self._add(dep)
+        self.warmup[name] = node['warmup'] + max([self.warmup[dep] for dep in node['inputs']], default=0)
+        self.nodes.append(name)
+
+    # -- Empty state, passing the state returned by a compute to the next one continues the same history -- #
+    def state(self):
+        return {'n': 0, 'tail': {col: np.empty(0) for col in self.inputs}, 'nodes': {name: {} for name in self.nodes}}
+
+    # -- Computes the rows of one chunk into out -- #
+    def _chunk(self, bars, out, state):
+        n = len(out)
+        ext = {col: np.concatenate([state['tail'][col], bars[col]]) for col in self.inputs}
+        ctx = {'n': n, 'ext': ext}
+        values = {}
+        for name in self.nodes:
+            node = _registry[name]
+            values[name] = node['fn'](ctx, state['nodes'][name], *(values[dep] for dep in node['inputs']))
+        for j, feature in enumerate(self.features):
+            out[:, j] = values[ALIASES.get(feature, feature)]
+        # Bars kept for the rolling windows and the lags of the next chunk
+        state['tail'] = {col: values[-self.lookback:] if self.lookback else values[:0] for col, values in ext.items()}
+        state['n'] += n
+
+    # -- Builds the float32 (n, len(features)) matrix, bars maps the columns in self.inputs to arrays (e.g. a DataFrame) -- #
+    # out can be a preallocated array (e.g. a memory-mapped file), state the one of a previous call to continue its history
+    def compute(self, bars, out=None, state=None, chunk=16_384):
+        bars = {col: np.asarray(bars[col], dtype=np.float64) for col in self.inputs}
+        if 'open' in bars and np.isnan(bars['open']).any():
+            raise ValueError('open must not contain NaN')
+        n = len(next(iter(bars.values()))) if bars else 0
+        if out is None:
+            out = np.empty((n, len(self.features)), dtype=np.float32)
+        elif out.shape != (n, len(self.features)):
+            raise ValueError(f'out must have shape {(n, len(self.features))}')
+        state = self.state() if state is None else state
+        for s in range(0, n, chunk):
+            self._chunk({col: values[s:s + chunk] for col, values in bars.items()}, out[s:s + chunk], state)
+        return out
+
+# Graphs already resolved, by list of features
+_graphs = {}
+
+def feature_graph(features=FEATURES):
+    key = tuple(features)
+    if key not in _graphs:
+        _graphs[key] = FeatureGraph(features)
+    return _graphs[key]
+
+LOOKBACK = feature_graph().lookback
+
+# -- Empty state of feature_matrix, passing the returned state to the next call continues the same history -- #
+def feature_state(features=FEATURES):
+    return feature_graph(features).state()
+
+# -- Builds the (n, len(features)) float32 feature matrix (by default the 30 features of the model) from the bars -- #
+def feature_matrix(open, high, low, volume, out=None, state=None, chunk=16_384, features=FEATURES, close=None):
+    bars = {'open': open, 'high': high, 'low': low, 'volume': volume, 'close': close}
+    return feature_graph(features).compute(bars, out, state, chunk)
+
+# -- Rows of a feature matrix where every feature is defined and their selector, a view when they are all the rows or the ones after lookback -- #
+def valid_features(X, lookback=LOOKBACK):
+    valid = ~np.isnan(X).any(axis=1)
+    if valid.all():
+        return X, slice(None)
+    if valid[lookback:].all() and not valid[:lookback].any():
+        return X[lookback:], slice(lookback, None)
+    return X[valid], valid
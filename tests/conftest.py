@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scripts import their siblings by name and are run from their own folder, the tests put the folders in the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ('Shared', 'Backtests_Scripts', 'LiveTrading'):
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from BacktestBenchmark import synthetic_csv
+from BacktestRunner import Backtest_LSTM, Backtest_Traditional
+
+# ---- Parity of the loop and numpy engines of run_backtest on small synthetic bars ---- #
+
+N_ROWS = 120
+COLUMNS = ['returns', 'holding', 'direction']
+PLOT_COLUMNS = ['long_open', 'short_open', 'long_short_close']
+
+class FixedLSTM(Backtest_LSTM):
+    def __init__(self, csv_path, entry):
+        super().__init__(csv_path, maximum_holding=6)
+        self.ub_mult = 1.002
+        self.lb_mult = 0.998
+        self.entry = entry
+
+    def generate_signals(self):
+        self.dmgt.df['entry'] = self.entry[:len(self.dmgt.df)]
+
+class FixedTraditional(Backtest_Traditional):
+    def __init__(self, csv_path, entry):
+        super().__init__(csv_path, 'timestamp', maximum_holding=6)
+        self.ub_mult = 1.002
+        self.lb_mult = 0.998
+        self.entry = entry
+
+    def generate_signals(self):
+        self.dmgt.df['entry'] = self.entry[:len(self.dmgt.df)]
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bars') / 'bars.csv'
+    synthetic_csv(path, N_ROWS, seed=3)
+    return str(path)
+
+# -- Signals on bars in a row, while a position is open, and on the last bars before end_date -- #
+def entries(n, scenario):
+    entry = np.zeros(n, dtype=np.int64)
+    if scenario == 'back_to_back':
+        entry[[3, 4, 5, 6]] = 1
+        entry[[20, 21, 40]] = -1
+        entry[[41, 42, 60, 61, 62]] = 1
+        entry[[n - 3, n - 2, n - 1]] = [-1, 1, 1]
+    elif scenario == 'before_end':
+        # Opened on the last bar and closed by the end_date barrier
+        entry[n - 2] = -1
+    elif scenario == 'last_bar':
+        # Opened after the last bar, never closed
+        entry[n - 1] = 1
+    else:
+        draw = np.random.default_rng(scenario).random(n)
+        entry = np.where(draw < 0.1, 1, np.where(draw > 0.9, -1, 0))
+    return entry
+
+def run(cls, csv_path, engine, scenario):
+    n = len(cls(csv_path, np.zeros(N_ROWS, dtype=np.int64)).dmgt.df)
+    system = cls(csv_path, entries(n, scenario))
+    system.run_backtest(engine=engine)
+    return system.dmgt.df
+
+@pytest.mark.parametrize('scenario', ['back_to_back', 'before_end', 'last_bar', 0, 1, 2])
+@pytest.mark.parametrize('cls, columns', [(FixedLSTM, COLUMNS + PLOT_COLUMNS), (FixedTraditional, COLUMNS)])
+def test_numpy_engine_matches_loop(csv_path, cls, columns, scenario):
+    loop = run(cls, csv_path, 'loop', scenario)
+    vectorized = run(cls, csv_path, 'numpy', scenario)
+    if scenario != 'last_bar':
+        assert (loop.returns != 0).any()
+    pd.testing.assert_frame_equal(vectorized[columns], loop[columns], check_dtype=False)
@@ -0,0 +1,36 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from BacktestStatistics import BacktestProfile, LedgerProfile
+from TripleBarrier import triple_barrier, TradeLedger
+
+def ledger_of(entry, close):
+    entry, close = np.asarray(entry), np.asarray(close, dtype=np.float64)
+    at_end = np.zeros(len(close), dtype=bool)
+    at_end[-1:] = True
+    trades = triple_barrier(entry, np.r_[close[1:], close[-1:]], close, at_end, 1.002, 0.998, 5)
+    return TradeLedger(trades, pd.date_range('2021-01-01', periods=len(close), freq='1min'))
+
+# -- Less than two bars: no warning, the ratios are NaN as the accuracies without trades -- #
+@pytest.mark.parametrize('entry, close', [([], []), ([0], [100.0]), ([1], [100.0])])
+def test_short_backtest_has_nan_ratios(entry, close):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        profile = LedgerProfile(ledger_of(entry, close), '1min')
+    assert np.isnan(profile.sharpe) and np.isnan(profile.cagr) and np.isnan(profile.calmar)
+    assert profile.total_return == 0 and profile.max_dd == 0
+
+def test_single_trade_matches_backtest_profile():
+    close = [100.0, 100.0, 99.5, 99.5]
+    ledger = ledger_of([1, 0, 0, 0], close)
+    assert len(ledger) == 1
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        profile = LedgerProfile(ledger, '1min')
+    bt = pd.DataFrame(ledger.to_dense())
+    bt.insert(0, 'timestamp', ledger.index)
+    reference = BacktestProfile(bt, '1min')
+    for name in ('n_trades', 'sharpe', 'calmar', 'max_dd', 'long_accuracy'):
+        assert getattr(profile, name) == pytest.approx(getattr(reference, name), nan_ok=True)
+    assert profile.total_return == pytest.approx(reference.total_return)
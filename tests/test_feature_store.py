@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+import FeatureStore as feature_store
+from FeatureStore import FeatureStore
+from FeatureBenchmark import synthetic_bars
+from BacktestBenchmark import synthetic_csv
+
+@pytest.fixture(scope='module')
+def bars():
+    return synthetic_bars(600)
+
+def build(path, bars, n):
+    store = FeatureStore(str(path))
+    store.update(bars.timestamp.values[:n], bars.iloc[:n])
+    return store
+
+def test_incremental_update_matches_full_build(tmp_path, bars):
+    store = build(tmp_path / 'incremental', bars, 300)
+    assert store.update(bars.timestamp.values, bars) == 300
+    full = build(tmp_path / 'full', bars, 600)
+    np.testing.assert_array_equal(store.matrix, full.matrix)
+    np.testing.assert_array_equal(store.index, full.index)
+    assert sorted(name for name in os.listdir(store.path) if name.startswith('state.')) == ['state.600.pkl']
+
+# -- An update interrupted after its state is written but before its meta leaves the previous store usable -- #
+def test_interrupted_update_resumes_from_committed_state(tmp_path, bars, monkeypatch):
+    path = tmp_path / 'store'
+    build(path, bars, 200)
+    replace = FeatureStore.replace
+    def fail(self, name, write, mode='w'):
+        if name == 'meta.json':
+            raise KeyboardInterrupt
+        replace(self, name, write, mode)
+    with monkeypatch.context() as m:
+        m.setattr(FeatureStore, 'replace', fail)
+        with pytest.raises(KeyboardInterrupt):
+            FeatureStore(str(path)).update(bars.timestamp.values[:400], bars.iloc[:400])
+    store = FeatureStore(str(path))
+    assert len(store) == 200
+    assert store.update(bars.timestamp.values, bars) == 400
+    np.testing.assert_array_equal(store.matrix, build(tmp_path / 'full', bars, 600).matrix)
+
+# -- A full rebuild (another history) replaces the files, the maps opened before keep the previous rows -- #
+def test_rebuild_keeps_open_maps_valid(tmp_path, bars):
+    store = build(tmp_path / 'store', bars, 600)
+    before = store.matrix
+    expected = np.array(before)
+    other = synthetic_bars(100, seed=1)
+    assert store.update(other.timestamp.values, other) == 100
+    np.testing.assert_array_equal(before, expected)
+    assert len(store) == len(store.matrix) == 100
+
+def test_sync_skips_unchanged_csv(tmp_path, monkeypatch):
+    synthetic_csv(tmp_path / 'source.csv', 400)
+    lines = (tmp_path / 'source.csv').read_text().splitlines(keepends=True)
+    csv_path = tmp_path / 'bars.csv'
+    csv_path.write_text(''.join(lines[:301]))
+    store = FeatureStore.for_csv(str(csv_path))
+    assert store.sync() > 0
+    n = len(store)
+    with monkeypatch.context() as m:
+        m.setattr(feature_store, 'DataManager_LSTM', None)
+        assert FeatureStore.for_csv(str(csv_path)).sync() == 0
+    # Bars appended to the csv are computed at the next sync
+    csv_path.write_text(''.join(lines))
+    store = FeatureStore.for_csv(str(csv_path))
+    assert store.sync() == 100 and len(store) == n + 100
@@ -0,0 +1,86 @@
+import asyncio
+import MarketData
+from DeribitWS import DeribitSession
+from MarketData import BarStream
+from Scheduler import BarScheduler
+
+class FakeSession:
+    def __init__(self):
+        self.channels = {}
+        self.reconnect_listeners = []
+
+    async def subscribe(self, channels, handler):
+        for channel in channels:
+            self.channels[channel] = handler
+
+class OfflineSession(FakeSession):
+    async def request(self, method, params):
+        raise ConnectionError('offline')
+
+class ClosedSocket:
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+def test_stream_only_subscribes_to_the_bars():
+    async def main():
+        session = FakeSession()
+        stream = BarStream(session, 'BTC-PERPETUAL', '1', lambda bar: None)
+        await stream.start()
+        assert list(session.channels) == ['chart.trades.BTC-PERPETUAL.1']
+        assert not stream.deliverer.done()
+        stream.deliverer.cancel()
+    asyncio.run(main())
+
+# -- A bar handler that raises stops the delivery, the error is reported -- #
+def test_delivery_error_is_reported(capsys):
+    def on_bar(bar):
+        raise RuntimeError('handler failed')
+    async def main():
+        stream = BarStream(FakeSession(), 'BTC-PERPETUAL', '1', on_bar)
+        await stream.start()
+        stream.on_chart({'tick': 0, 'open': 1, 'high': 1, 'low': 1, 'close': 1, 'volume': 1})
+        stream.on_chart({'tick': 60_000, 'open': 1, 'high': 1, 'low': 1, 'close': 1, 'volume': 1})
+        await asyncio.sleep(0.01)
+        assert stream.deliverer.done()
+    asyncio.run(main())
+    assert "handler failed" in capsys.readouterr().out
+
+# -- The reconnection started when the connection is lost is kept and its failure (e.g. auth refused) is reported -- #
+def test_failed_restore_is_reported(capsys):
+    async def main():
+        session = DeribitSession('wss://example.invalid')
+        session.channels['chart.trades.BTC-PERPETUAL.1'] = lambda data: None
+        async def connect():
+            raise Exception('Auth failed with error invalid_credentials')
+        session.connect = connect
+        await session.read(ClosedSocket())
+        assert session.restorer is not None
+        await asyncio.wait({session.restorer})
+    asyncio.run(main())
+    assert 'Auth failed' in capsys.readouterr().out
+
+# -- Bars that cannot be backfilled are reported as a gap before the next bar, the scheduler records them as missed -- #
+def test_failed_backfill_is_reported_as_a_gap(monkeypatch, capsys):
+    monkeypatch.setattr(MarketData, 'BACKFILL_ATTEMPTS', 1)
+    events = []
+    async def main():
+        scheduler = BarScheduler(60_000, lambda bar, decide: events.append(('bar', bar['ticks'])),
+                                 on_gap=lambda start, end: events.append(('gap', start, end)))
+        scheduler.loop = asyncio.get_running_loop()
+        scheduler.bars = asyncio.Queue()
+        stream = BarStream(OfflineSession(), 'BTC-PERPETUAL', '1', scheduler.put, on_gap=scheduler.put_gap)
+        stream.last_closed = 0
+        await stream.backfill(60_000, 180_000)
+        stream.emit({'ticks': 240_000})
+        await asyncio.sleep(0)
+        while not scheduler.bars.empty():
+            await scheduler.handle(scheduler.bars.get_nowait())
+        scheduler.executor.shutdown()
+        return scheduler
+    scheduler = asyncio.run(main())
+    assert events == [('gap', 60_000, 180_000), ('bar', 240_000)]
+    assert scheduler.missed == [60_000, 120_000, 180_000]
+    assert 'could not be backfilled' in capsys.readouterr().out
@@ -0,0 +1,26 @@
+import os
+import pytest
+from ModelRegistry import get_model, registry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(ROOT, 'LSTM_Models', 'test_69.npz')
+SCALER = os.path.join(ROOT, 'LSTM_MinMaxModels', 'MinMaxModel_test_69.pkl')
+
+@pytest.fixture
+def name():
+    pytest.importorskip('sklearn')
+    yield 'registry_test'
+    if 'registry_test' in registry:
+        registry.unregister('registry_test')
+
+def test_get_model_rejects_other_paths(name, tmp_path):
+    version = get_model(name, MODEL, SCALER)
+    # Same name without paths or with the same ones (even written differently) is the registered version
+    assert get_model(name) is version
+    assert get_model(name, os.path.relpath(MODEL), SCALER) is version
+    other = tmp_path / 'other.npz'
+    other.write_bytes(open(MODEL, 'rb').read())
+    with pytest.raises(ValueError, match='already registered'):
+        get_model(name, str(other), SCALER)
+    with pytest.raises(ValueError, match='already registered'):
+        get_model(name, MODEL, str(tmp_path / 'scaler.pkl'))
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from BacktestBenchmark import synthetic_csv
+from Datamanager import DataManager_Traditional
+from MultiStrategy import MultiStrategyBacktest
+from Backtest_Traditional import MomentumRSI, HigherLower
+
+# ---- Signals of the strategies registered on a MultiStrategyBacktest against their own Backtest_Traditional ---- #
+
+MOMENTUM = {'max_holding': 10, 'ub_mult': 1.003, 'lb_mult': 0.997, 'rsi_window': 14, 'rsi_long': 45, 'rsi_short': 55, 'ma_long': 26, 'ma_short': 12}
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp('bars') / 'bars.csv'
+    synthetic_csv(path, 20_000, seed=5)
+    # Missing minutes, the 20min resampling has empty bins
+    bars = pd.read_csv(path)
+    bars.drop(index=np.r_[3_000:3_300, 11_000:11_050]).to_csv(path, index=False)
+    return str(path)
+
+# -- Entry column of the strategy backtested on its own, on the complete bars -- #
+def standalone_entry(csv_path, strategy, params, index):
+    dmgt = DataManager_Traditional(csv_path, 'timestamp')
+    dmgt.change_resolution('20min')
+    system = strategy(dmgt, None, **params)
+    system.generate_signals()
+    return system.dmgt.df.entry.reindex(index).fillna(0).values
+
+def test_registered_strategies_match_standalone(csv_path):
+    momentum_9 = dict(MOMENTUM, rsi_window=9)
+    bt = MultiStrategyBacktest(csv_path, 'timestamp', timeframe='20min')
+    bt.register_strategy('momentum_rsi', MomentumRSI, MOMENTUM)
+    bt.register_strategy('momentum_rsi_9', MomentumRSI, momentum_9)
+    bt.register_strategy('higher_lower', HigherLower, {'max_holding': 10})
+    results = bt.run_backtest()
+
+    np.testing.assert_array_equal(results.momentum_rsi_entry.values, standalone_entry(csv_path, MomentumRSI, MOMENTUM, results.index))
+    np.testing.assert_array_equal(results.momentum_rsi_9_entry.values, standalone_entry(csv_path, MomentumRSI, momentum_9, results.index))
+    np.testing.assert_array_equal(results.higher_lower_entry.values, standalone_entry(csv_path, HigherLower, {'max_holding': 10}, results.index))
+    # The moving averages are computed once for both MomentumRSI strategies
+    assert sorted(bt.indicators) == ['ma_12_frame', 'ma_26_frame', 'rsi_14_frame', 'rsi_9_frame']
+
+def test_register_strategy_rejects_unknown_parameters(csv_path):
+    bt = MultiStrategyBacktest(csv_path, 'timestamp', timeframe='20min')
+    with pytest.raises(ValueError):
+        bt.register_strategy('higher_lower', HigherLower, {'max_holding': 10, 'rsi_window': 14})
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+from NumpyLSTM import export_npz, equivalence_check, NumpyModel
+
+MODELS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'LSTM_Models')
+
+@pytest.fixture(scope='module')
+def keras():
+    pytest.importorskip('h5py')
+    return pytest.importorskip('tensorflow').keras
+
+# -- Stacked LSTMs (with and without return_sequences) and Dense layers exported from a Keras model saved as .h5 -- #
+def test_export_matches_keras(keras, tmp_path):
+    keras.utils.set_random_seed(0)
+    model = keras.Sequential([
+        keras.Input((5, 7)),
+        keras.layers.LSTM(16, return_sequences=True),
+        keras.layers.LSTM(8),
+        keras.layers.Dense(4, activation='relu'),
+        keras.layers.Dense(1),
+    ])
+    h5_path = str(tmp_path / 'model.h5')
+    model.save(h5_path)
+    path = export_npz(h5_path)
+    assert equivalence_check(h5_path, path, n_rows=2_000) < 1e-5
+    inputs = np.random.default_rng(1).uniform(0, 1, (3, 5, 7)).astype(np.float32)
+    np.testing.assert_allclose(NumpyModel(path)(inputs), np.asarray(model(inputs)), rtol=1e-5, atol=1e-6)
+
+# -- The committed export of test_69 is the one of its .h5 and gives the predictions of the Keras model -- #
+def test_committed_export_matches_keras(keras, tmp_path):
+    h5_path = os.path.join(MODELS, 'test_69.h5')
+    committed = os.path.join(MODELS, 'test_69.npz')
+    with np.load(export_npz(h5_path, str(tmp_path / 'test_69.npz'))) as fresh, np.load(committed) as saved:
+        assert sorted(fresh.files) == sorted(saved.files)
+        for name in fresh.files:
+            np.testing.assert_array_equal(fresh[name], saved[name])
+    assert equivalence_check(h5_path, committed, n_rows=2_000) < 1e-5
@@ -0,0 +1,7 @@
+import pytest
+from StreamingIndicator import parity_check, PARITY_TOLERANCE
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_streaming_matches_batch(seed):
+    # parity_check raises when the max relative error is above PARITY_TOLERANCE
+    assert parity_check(n_rows=3_000, seed=seed) <= PARITY_TOLERANCE
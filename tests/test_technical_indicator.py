@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+from FeatureBenchmark import synthetic_bars
+from TechnicalIndicator import get_technical_indicators
+
+# -- The cumulative log returns are log_ret_1..3 and log_ret_1..5 whatever the columns of the bars and their order -- #
+def test_cum_log_ret_by_name():
+    bars = synthetic_bars(200)
+    # Layout of the live bars: the chart data response has other columns, in another order
+    live = bars[['close', 'volume', 'high', 'low', 'open']].assign(cost=1.0, status='ok', ticks=np.arange(200))
+    for frame in (bars, live):
+        df = get_technical_indicators(frame.copy())
+        pd.testing.assert_series_equal(df['cum_log_ret_3'], df['log_ret_1'] + df['log_ret_2'] + df['log_ret_3'], check_names=False)
+        pd.testing.assert_series_equal(df['cum_log_ret_5'], df[[f'log_ret_{i}' for i in range(1, 6)]].sum(axis=1, skipna=False),
+                                       check_names=False, rtol=1e-12)
+        pd.testing.assert_series_equal(df['diff_cum_log_ret'], df['log_ret_4'] + df['log_ret_5'], check_names=False, rtol=1e-9)
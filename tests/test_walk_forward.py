@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+from WalkForward import evaluate_slice
+
+BARRIERS = {'ub_mult': 1.002, 'lb_mult': 0.998, 'max_holding': 5}
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    close = 40_000 * np.exp(np.cumsum(rng.normal(0, 1e-3, 50)))
+    index = pd.date_range('2021-01-01', periods=50, freq='1min')
+    return pd.DataFrame({'close': close, 't_plus': np.r_[close[1:], close[-1]], 'entry': rng.integers(-1, 2, 50)}, index=index)
+
+@pytest.mark.parametrize('dense', [False, True])
+def test_empty_slice_has_no_trade(data, dense):
+    metrics, bt = evaluate_slice(data, 'entry', BARRIERS, '1min', 10, 10, dense=dense)
+    assert metrics.keys() == evaluate_slice(data, 'entry', BARRIERS, '1min', 0, 50, dense=False)[0].keys()
+    assert metrics['n_trades'] == 0 and metrics['total_return'] == 0 and np.isnan(metrics['sharpe'])
+    assert bt is None if not dense else bt.empty
+
+def test_dense_and_ledger_metrics_agree(data):
+    ledger = evaluate_slice(data, 'entry', BARRIERS, '1min', 0, 50, dense=False)[0]
+    dense = evaluate_slice(data, 'entry', BARRIERS, '1min', 0, 50)[0]
+    assert ledger['n_trades'] == dense['n_trades'] > 0